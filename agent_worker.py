@@ -0,0 +1,172 @@
+import re
+import queue
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import AgentAction, AgentFinish
+
+from revised_tools.python_repl.pool import current_session
+
+
+# agent runs shared by every session of the process
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='chatmof-agent')
+
+
+class CancelledRun(Exception):
+    pass
+
+
+@dataclass
+class StepEvent:
+    kind: str  # thought, action, observation, log, image, html, final, error, cancelled
+    text: str = ''
+    tool: Optional[str] = None
+    image: Optional[bytes] = field(default=None, repr=False)
+    html: Optional[str] = field(default=None, repr=False)
+    error: Optional[BaseException] = field(default=None, repr=False)
+
+
+_TOOL_FIELD = re.compile(r"\[(?P<tool>\w+)\] (?P<name>[A-Z][\w ]*?):")
+
+
+def _split_thought(log: str) -> str:
+    thought = log.split('Action:')[0].split('Final Answer:')[0]
+    return thought.replace('Thought:', '').strip()
+
+
+def format_log(text: str) -> str:
+    """markdown of a tool log : `[Predictor] Property: ...` -> `**[Predictor]** `Property`: ...`"""
+    return _TOOL_FIELD.sub(
+        lambda t: '\n**[{}]** `{}`:'.format(t.group('tool'), t.group('name')), text
+    ).strip().replace('\n', '  \n')  # markdown line breaks
+
+
+class EventCallbackHandler(BaseCallbackHandler):
+    """Turn agent callbacks into StepEvents on a queue and stop the run on cancellation.
+
+    Tool logs arrive from `run_manager.on_text` in small fragments; they are buffered
+    and emitted as one `log` event per group of complete lines and at every step
+    boundary (action, observation, finish), so the UI renders per step, not per fragment.
+    """
+    raise_error: bool = True  # let CancelledRun propagate out of the callback manager
+
+    def __init__(self, events: 'queue.Queue[StepEvent]', cancelled: threading.Event) -> None:
+        self.events = events
+        self.cancelled = cancelled
+        self._buffer: List[str] = []
+
+    def _flush(self, complete_lines_only: bool = False) -> None:
+        text = ''.join(self._buffer)
+        rest = ''
+        if complete_lines_only:
+            text, _, rest = text.rpartition('\n')
+        self._buffer = [rest] if rest else []
+        if text := format_log(text):
+            self.events.put(StepEvent('log', text))
+
+    def _check(self) -> None:
+        if self.cancelled.is_set():
+            raise CancelledRun()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._check()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], **kwargs: Any) -> None:
+        self._check()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        self._check()
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> None:
+        self._flush()
+        if thought := _split_thought(action.log):
+            self.events.put(StepEvent('thought', thought))
+        self.events.put(StepEvent('action', str(action.tool_input), tool=action.tool))
+
+    def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        self._flush()
+        self.events.put(StepEvent('observation', str(output)))
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._flush()
+
+    def on_text(self, text: str, **kwargs: Any) -> None:
+        if text.startswith('Prompt after formatting'):  # LLMChain prompts
+            return
+        # images and viewers are displayed by the UI thread : tools running in this
+        # worker thread have no ScriptRunContext, so st.* calls there would be dropped
+        caption = kwargs.get('caption', text.split(':', 1)[-1].strip())
+        if (image := kwargs.get('image')) is not None:
+            self._flush()
+            self.events.put(StepEvent('image', caption, image=image))
+            return
+        if (html := kwargs.get('html')) is not None:
+            self._flush()
+            self.events.put(StepEvent('html', caption, html=html))
+            return
+        self._buffer.append(text)
+        if '\n' in text:
+            self._flush(complete_lines_only=True)
+
+    def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> None:
+        self._flush()
+        if thought := _split_thought(finish.log):
+            self.events.put(StepEvent('thought', thought))
+
+
+class AgentRun(object):
+    """Run `chatmof.run(question)` on a background worker.
+
+    Step events are emitted on a queue; the UI polls them on every rerun instead of
+    holding its script thread for the whole chain.
+    """
+    def __init__(self, chatmof, question: str, session_id: str = 'default') -> None:
+        self.chatmof = chatmof
+        self.question = question
+        self.session_id = session_id  # python REPL state is kept per session
+        self.events: List[StepEvent] = []  # every event polled so far (re-rendered on reruns)
+        self.answer: Optional[str] = None
+
+        self._queue: 'queue.Queue[StepEvent]' = queue.Queue()
+        self._cancelled = threading.Event()
+        self._future: Optional[Future] = None
+
+    def start(self) -> 'AgentRun':
+        self._future = _EXECUTOR.submit(self._target)
+        return self
+
+    def _target(self) -> None:
+        handler = EventCallbackHandler(self._queue, self._cancelled)
+        current_session.set(self.session_id)
+        try:
+            self.answer = self.chatmof.run(self.question, callbacks=[handler])
+            self._queue.put(StepEvent('final', self.answer))
+        except CancelledRun:
+            self._queue.put(StepEvent('cancelled', 'The run was cancelled.'))
+        except BaseException as e:  # ChatMOFOnlineError is a BaseException
+            self._queue.put(StepEvent('error', str(e), error=e))
+
+    def poll(self) -> List[StepEvent]:
+        """Return the new events (also appended to `self.events`)"""
+        new_events = []
+        while True:
+            try:
+                new_events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self.events.extend(new_events)
+        return new_events
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._future is not None and self._future.done()
@@ -10,6 +10,9 @@ config = {
     # LLM - openAI
     'temperature': 0.0,    
     'model': 'gpt-4',
+    'llm_cache': os.path.join(__root_dir__, 'database/cache/llm.sqlite'),  # None: no cache
+    'llm_cache_ttl': 7 * 24 * 3600,  # seconds before a cached generation expires
+    'llm_cache_size': 100_000,  # maximum number of cached generations
 
     # data directory
     'model_dir': os.path.join(__root_dir__, 'database/load_model/'),
@@ -20,18 +23,45 @@ config = {
 
     # table searcher
     'lookup_dir': os.path.join(__root_dir__, 'database/tables/coremof.xlsx'),
+    'prediction_table': os.path.join(__root_dir__, 'database/tables/predictions.parquet'),
     'max_iteration': 3,
 
     # building block searcher
     'buildingblock_dir' : os.path.join(__root_dir__, 'database/tables/mofkey.xlsx'),
+    'bb_feature_path': os.path.join(__root_dir__, 'database/tables/bb_features.npz'),
 
     # predictor
     'max_length_in_predictor' : 30,
     'accelerator' : 'cuda',
+    'inference_engine': 'direct',  # 'direct' (torch.inference_mode on cpu) or 'trainer'
+    'model_pool_budget': 4 * 1024 ** 3,  # bytes of resident model weights
+    'prediction_cache': os.path.join(__root_dir__, 'database/cache/predictions.sqlite'),
+    'prediction_cache_size': 1_000_000,  # maximum number of cached predictions
+    'stream_chunk_size': 1024,  # number of CIFs per streamed prediction chunk
+    'stream_dir': None,  # directory of streamed parquet files (None: system temp)
+    'material_index_dir': os.path.join(__root_dir__, 'database/cache/'),
+
+    # visualizer
+    'render_cache_size': 64 * 1024 ** 2,  # bytes of rendered images kept in memory
+    'structure_cache_size': 256 * 1024 ** 2,  # bytes of parsed structures shared by the tools
+    'visualizer_mode': 'image',  # 'image' (static png) or '3d' (interactive py3Dmol viewer)
+    'viewer_max_atoms': 10000,  # atoms sent to the 3d viewer (larger cells are decimated)
+    'num_workers_render': None,  # processes rendering several structures (None: all cores)
+
+    # python repl
+    'num_workers_repl': None,  # sandboxed REPL worker processes (None: up to 4)
+    'repl_cpu_time': 30,  # seconds of CPU per execution
+    'repl_timeout': 60,  # seconds of wall clock per execution (the worker is killed)
+    'repl_memory_limit': 2 * 1024 ** 3,  # bytes the executed code may allocate
 
     # generator
     'num_genetic_cycle': 3,
     'num_parents': 200,
     'logger': 'generate_mof.log',
+    'num_workers_generate': None,  # processes building children (None: all cores)
+    'build_timeout': 60,  # seconds per child (build + data preparation)
+    'build_memory_limit': 8 * 1024 ** 3,  # bytes of address space per build worker
+    'build_jobs_per_worker': 50,  # build workers are recycled after this many jobs
+    'genome_store_dir': os.path.join(__root_dir__, 'database/structures/generate/genomes'),
     'topologies': ['pcu', 'dia', 'acs', 'rtl', 'cds', 'srs', 'ths', 'bcu', 'fsc'],
 }
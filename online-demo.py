@@ -1,9 +1,12 @@
+import uuid
+
 import streamlit as st
+import streamlit.components.v1 as components
 from openai.error import AuthenticationError
-from langchain.chat_models import ChatOpenAI
 
 from chatmof import ChatMOF
-from utils import from_llm_revised, capture_stdout
+from utils import from_llm_revised, load_chatmof, load_questions
+from agent_worker import AgentRun, StepEvent
 from revised_tools.error import ChatMOFOnlineError
 
 
@@ -22,10 +25,76 @@ description = """- **ChatMOF** is an autonomous Artificial Intelligence (AI) sys
 ## Start!
 """
 
+poll_interval = 0.5  # seconds between refreshes while the agent is running
+
+ChatMOF.from_llm = from_llm_revised  # revise functions in ChatMOF
+
+
+def render_event(event: StepEvent):
+    if event.kind == 'thought':
+        st.markdown(f'`Thought`: {event.text}')
+    elif event.kind == 'action':
+        st.markdown(f'`Action`: {event.tool}\n\n`Action Input`: {event.text}')
+    elif event.kind == 'observation':
+        st.markdown(f'`Observation`: {event.text}')
+    elif event.kind == 'log':
+        st.markdown(event.text)
+    elif event.kind == 'image':
+        st.image(event.image, caption=event.text, use_column_width=True)
+    elif event.kind == 'html':
+        components.html(event.html, height=420)
+    elif event.kind == 'final':
+        st.subheader('Final Answer')
+        st.text_area('', value=event.text, height=100,
+                     max_chars=None, key=None)
+    elif event.kind == 'cancelled':
+        st.info(event.text)
+    elif event.kind == 'error':
+        if isinstance(event.error, AuthenticationError):
+            st.warning(
+                'Incorrect API key provied. You can find your API key at https://platform.openai.com/account/api-keys')
+        elif isinstance(event.error, ChatMOFOnlineError):
+            st.warning(event.text)
+        else:
+            st.error(event.text)
+
+
+def _render_run(run: AgentRun) -> None:
+    running = not run.done
+    run.poll()  # after `done` : a finished run has queued all of its events
+
+    col1, col2 = st.columns((8, 1))
+    with col1:
+        st.subheader('Running...' if running else 'Finished')
+    with col2:
+        if running and st.button('Cancel', disabled=run.cancelled):
+            run.cancel()
+
+    for event in run.events:
+        render_event(event)
+
+
+_fragment = getattr(st, 'fragment', None) or st.experimental_fragment
 
-def run_demo():
-    ChatMOF.from_llm = from_llm_revised  # revise functions in ChatMOF
 
+@_fragment(run_every=poll_interval)
+def _render_running(run: AgentRun) -> None:
+    """Only this fragment is rerun every `poll_interval` seconds, not the whole script"""
+    if run.done:
+        rerun = getattr(st, 'rerun', None) or st.experimental_rerun
+        rerun()  # the finished run is rendered once more, without polling
+    _render_run(run)
+
+
+def render_run(run: AgentRun):
+    """Render the events of a background run, refreshed until it finishes"""
+    if run.done:
+        _render_run(run)
+    else:
+        _render_running(run)
+
+
+def run_demo():
     with st.sidebar:
         st.header('OpenAI ChatModel')
         selected_model = st.selectbox(
@@ -38,21 +107,14 @@ def run_demo():
         'Enter OpenAI api key below 👇', value=default_openai_key)
 
     if openai_api_key:
-        llm = ChatOpenAI(
-            temperature=selected_temp,
+        chatmof = load_chatmof(
             model_name=selected_model,
-            openai_api_key=openai_api_key
-        )
-
-        chatmof = ChatMOF.from_llm(
-            llm=llm,
+            temperature=selected_temp,
+            openai_api_key=openai_api_key,
             verbose=verbose,
         )
 
-    with open('questions.txt') as f:
-        questions = [
-            line.strip() for line in f
-        ]
+    questions = load_questions('questions.txt')
 
     st.title(title)
     st.write(description)
@@ -78,23 +140,18 @@ def run_demo():
             st.warning('You have to enter your OpenAI api key!')
 
         elif input_question:
-            st.subheader('Running...')
-            try:
-                with capture_stdout():
-                    text = chatmof.run(input_question)
-                st.subheader('Final Answer')
-                st.text_area('', value=text, height=100,
-                             max_chars=None, key=None)
-            except AuthenticationError:
-                st.warning(
-                    'Incorrect API key provied. You can find your API key at https://platform.openai.com/account/api-keys')
-
-            except ChatMOFOnlineError as e:
-                st.warning(str(e))
+            previous = st.session_state.get('agent_run')
+            if previous is not None and not previous.done:
+                previous.cancel()
+            session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+            st.session_state['agent_run'] = AgentRun(chatmof, input_question, session_id).start()
 
         else:
             st.warning('Please enter a question.')
 
+    if st.session_state.get('agent_run') is not None:
+        render_run(st.session_state['agent_run'])
+
 
 if __name__ == '__main__':
     run_demo()
@@ -18,7 +18,9 @@ from chatmof.tools.search_csv.base import TableSearcher
 from revised_tools.genetic_algorithm.genetic_algorithm import GeneticAlgorithmChain
 from revised_tools.genetic_algorithm.prompt import PLAN_PROMPT
 from revised_tools.genetic_algorithm.cif_generate import CIFGenerator
+from revised_tools.genetic_algorithm.pipeline import TopologyPipeline
 from revised_tools.error import ChatMOFOnlineError
+from revised_tools.llm_cache import CachedLLMChain, get_prompt_cache
 
 
 class Generator(Chain):
@@ -102,82 +104,48 @@ class Generator(Chain):
 
     def run_genetic(self, df_dict, output, run_manager, cycle, info_ls):
         self._write_log('Find Parents', output['Search'], run_manager)
+        self._write_log('Get Children', output['Generate'], run_manager)
 
         prop = output['Property']
         direc = Path(config['generate_dir']) / f'{prop}-{cycle}'
-
-        parent_dict = dict()
         information = f'Information of models : {info_ls}. If unit or condition are existed, you must include it in the final output.'
 
-        for topology in self.topologies:
-            searcher = TableSearcher.from_dataframe(
-                llm=self.llm,
-                dataframe = df_dict[topology],
-                verbose=self.verbose,
-                run_manager=run_manager,
-            )            
-            prompt = "{} (Objective: {}). If you need to set a range of data, you need to make it wide to make the data exist."\
-                    .format(output['Search'], output['Objective'])
-            search_output = searcher.run(
-                question=prompt, 
-                return_observation=True,
-                run_manager = run_manager,
-                information=information,
-            )
-            parents = self._parse_predictor(search_output)
-
-            if not parents:
-                continue
-                
-            parent_dict[topology] = parents
-
-        if not parent_dict:
-            raise ValueError('There are no parents') 
-    
-        self._write_log('Get Children', output['Generate'], run_manager)
-
-        child_dict = dict()
-        for topology in self.topologies:
-            if not topology in parent_dict.keys():
-                continue
-
-            children = self.generator_chain.run(
-                question=output['Generate'],
-                parents=parent_dict[topology],
-                run_manager=run_manager,
-            )
-            child_dict[topology] = children
-            print (children)
-
-        self._write_log('Generate Structures', '', run_manager)
-
-        generator = CIFGenerator(direc)
-        for topology in self.topologies:
-            if topology not in child_dict.keys():
-                continue
-            generator.run(topology=topology, cif_list=child_dict[topology])
-
-        self._write_log('Predict Properties', output['Property']+"\n", run_manager)
-        
-        df_ls = []
-        for topology in self.topologies:
-            if topology not in child_dict.keys():
-                continue
-            try:
-                df_gen, info_ls = self.run_predictor(
-                    prop_text=output['Property'], 
-                    topology=topology, 
-                    data_dir=direc,
-                )
-            except ValueError:
-                continue
+        pipeline = TopologyPipeline(self, run_manager)
+        df_gen_dict = pipeline.run(df_dict, output, direc, information)
+        self._write_log('Stage times', '\n' + pipeline.stage_times().to_markdown() + '\n', run_manager)
 
+        for topology, df_gen in df_gen_dict.items():
             df_dict[topology] = df_dict[topology].merge(df_gen, how='outer')
-            df_ls.append(df_gen)
 
-        pd.concat(df_ls).to_csv(str(direc/f'../{prop}-{cycle}.csv'))
+        if df_gen_dict:
+            pd.concat(df_gen_dict.values()).to_csv(str(direc/f'../{prop}-{cycle}.csv'))
         return df_dict
 
+    def _search_parents(self, df, output, information, run_manager) -> List[List[str]]:
+        searcher = TableSearcher.from_dataframe(
+            llm=self.llm,
+            dataframe = df,
+            verbose=self.verbose,
+            run_manager=run_manager,
+        )            
+        prompt = "{} (Objective: {}). If you need to set a range of data, you need to make it wide to make the data exist."\
+                .format(output['Search'], output['Objective'])
+        search_output = searcher.run(
+            question=prompt, 
+            return_observation=True,
+            run_manager = run_manager,
+            information=information,
+        )
+        return self._parse_predictor(search_output)
+
+    def _propose_children(self, parents, output, run_manager) -> List[str]:
+        children = self.generator_chain.run(
+            question=output['Generate'],
+            parents=parents,
+            run_manager=run_manager,
+        )
+        return children
+
     def _parse_output(self, text):
         thought = re.search(r"Thought:\s*(.+?)\s*\n", text, re.DOTALL)
         search = re.search(r"Search look-up table:\s*(.+?)\s*\n", text, re.DOTALL)
@@ -223,19 +191,8 @@ class Generator(Chain):
         )
         
         material = f'{topology}*.cif'
-        df_ls = []
-        info_ls = []
-        for prop in self._parse_property(prop_text):
-            cif_id, logits, model_info = runner.run(prop, material)
-            df = pd.DataFrame({'cif_id': cif_id, prop: logits})
-            df_ls.append(df)
-            info_ls.append(model_info)
-
-        df_total = df_ls[0]
-        for df in df_ls[1:]:
-            df_total.merge(df, on='cif_id', how='outer')
-
-        return df, model_info
+        df, info_ls = runner.run_many(self._parse_property(prop_text), material)
+        return df, info_ls
 
     def _parse_predictor(self, output: str) -> List[List[str]]: 
         try:
@@ -284,7 +241,7 @@ class Generator(Chain):
             partial_variables={'model_names': model_names},
             input_variables=['question']
         )
-        llm_chain = LLMChain(llm=llm, prompt=prompt)
+        llm_chain = CachedLLMChain(llm=llm, prompt=prompt, prompt_cache=get_prompt_cache())
         genetic_chain = GeneticAlgorithmChain.from_llm(llm)
 
         return cls(
@@ -0,0 +1,135 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chatmof import __root_dir__
+from chatmof.config import config
+
+
+EDGE_CONNECTION_POINTS = 2
+
+
+class BuildingBlockFeatures(object):
+    """Precomputed features of the PORMAKE building blocks, stored as NumPy arrays.
+
+    - has_metal, n_connection_points : one value per building block
+    - topo_cn : connection number of each node type of `topologies` (-1 padded)
+
+    Used to reject children in bulk before any PORMAKE work:
+    exactly one of the two blocks must have metal, and their connection points
+    must fit the node (and edge) types of the topology.
+    """
+    def __init__(
+        self,
+        names: np.ndarray,
+        has_metal: np.ndarray,
+        n_connection_points: np.ndarray,
+        topologies: np.ndarray,
+        topo_cn: np.ndarray,
+    ) -> None:
+        self.names = names
+        self.has_metal = has_metal
+        self.n_connection_points = n_connection_points
+        self.topologies = topologies
+        self.topo_cn = topo_cn
+
+        self._bb_index: Dict[str, int] = {str(name): i for i, name in enumerate(names)}
+        self._topo_index: Dict[str, int] = {str(name): i for i, name in enumerate(topologies)}
+
+    @classmethod
+    def build(cls, database, topologies: List[str]) -> 'BuildingBlockFeatures':
+        names = sorted(database._get_bb_list())
+        has_metal = np.zeros(len(names), dtype=bool)
+        n_connection_points = np.zeros(len(names), dtype=np.int16)
+        for i, name in enumerate(names):
+            bb = database.get_bb(name)
+            has_metal[i] = bb.has_metal
+            n_connection_points[i] = bb.n_connection_points
+
+        unique_cn = [list(database.get_topo(topo).unique_cn) for topo in topologies]
+        topo_cn = np.full((len(topologies), max(map(len, unique_cn))), -1, dtype=np.int16)
+        for i, cn in enumerate(unique_cn):
+            topo_cn[i, :len(cn)] = cn
+
+        return cls(np.array(names), has_metal, n_connection_points, np.array(topologies), topo_cn)
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(exist_ok=True, parents=True)
+        np.savez_compressed(
+            path,
+            names=self.names,
+            has_metal=self.has_metal,
+            n_connection_points=self.n_connection_points,
+            topologies=self.topologies,
+            topo_cn=self.topo_cn,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'BuildingBlockFeatures':
+        with np.load(path) as data:
+            return cls(**{key: data[key] for key in data.files})
+
+    def valid_mask(self, topology: str, cif_list: List[str]) -> np.ndarray:
+        """True for children ({bb1}+{bb2}) that can be built on `topology`"""
+        if topology not in self._topo_index or not cif_list:
+            return np.ones(len(cif_list), dtype=bool)
+
+        pairs = [cif.split('+') for cif in cif_list]
+        idx1 = np.array([self._bb_index.get(bb1, -1) for bb1, _ in pairs])
+        idx2 = np.array([self._bb_index.get(bb2, -1) for _, bb2 in pairs])
+        is_edge = np.array([bb2.startswith('E') for _, bb2 in pairs], dtype=bool)
+        known = (idx1 >= 0) & (idx2 >= 0)
+        idx1, idx2 = np.where(known, idx1, 0), np.where(known, idx2, 0)
+
+        cn = self.topo_cn[self._topo_index[topology]]
+        n_node_types = int((cn >= 0).sum())
+        cp1 = self.n_connection_points[idx1]
+        cp2 = self.n_connection_points[idx2]
+
+        # one metal cluster only
+        metal = self.has_metal[idx1] ^ self.has_metal[idx2]
+        # node + edge : one node type / node + node : two node types
+        if n_node_types == 1:
+            fit = is_edge & (cp1 == cn[0]) & (cp2 == EDGE_CONNECTION_POINTS)
+        elif n_node_types == 2:
+            fit = ~is_edge & (cp1 == cn[0]) & (cp2 == cn[1])
+        else:
+            fit = np.zeros(len(cif_list), dtype=bool)
+
+        return known & metal & fit
+
+    def prefilter(self, topology: str, cif_list: List[str]) -> Tuple[List[str], List[str]]:
+        """Return (valid children, rejected children)"""
+        mask = self.valid_mask(topology, cif_list)
+        valid = [cif for cif, ok in zip(cif_list, mask) if ok]
+        rejected = [cif for cif, ok in zip(cif_list, mask) if not ok]
+        return valid, rejected
+
+
+_FEATURES: Optional[BuildingBlockFeatures] = None
+_FEATURES_LOCK = threading.Lock()
+
+
+def get_bb_features(
+    database,
+    path: str = config.get('bb_feature_path', os.path.join(__root_dir__, 'database/tables/bb_features.npz')),
+    topologies: List[str] = config['topologies'],
+) -> BuildingBlockFeatures:
+    """Load the feature table, or build and save it from the PORMAKE database"""
+    global _FEATURES
+    with _FEATURES_LOCK:
+        if _FEATURES is not None:
+            return _FEATURES
+
+        if os.path.exists(path):
+            features = BuildingBlockFeatures.load(path)
+            if set(topologies) <= set(features.topologies.tolist()):
+                _FEATURES = features
+                return _FEATURES
+
+        _FEATURES = BuildingBlockFeatures.build(database, topologies)
+        _FEATURES.save(path)
+        return _FEATURES
@@ -1,20 +1,75 @@
 import os
-from typing import List, Optional
+import time
+import contextlib
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
+from collections import defaultdict
+from functools import lru_cache, partial
 from tqdm import tqdm
 import logging
-from timeout_decorator import timeout
 
-import pormake as pm
-from moftransformer.utils.prepare_data import make_prepared_data
 from chatmof.config import config
+from revised_tools.structure_cache import Structure, get_structure_cache
+from revised_tools.genetic_algorithm.supervisor import (
+    BuildSupervisor, BuildTimeoutError, WorkerDiedError
+)
+from revised_tools.genetic_algorithm.bb_features import get_bb_features
+from revised_tools.genetic_algorithm.genome_store import (
+    GenomeStore, get_genome_store, SUCCESS, FAILED
+)
 
 
-pm.log.disable_print()
-pm.log.disable_file_print()   
+def is_transient(error: BaseException) -> bool:
+    """Failures caused by the load of the machine rather than by the child itself
+    (timeout, killed worker, out of memory). They are not stored as FAILED, so the
+    child is built again in a later run."""
+    if isinstance(error, (BuildTimeoutError, WorkerDiedError, MemoryError)):
+        return True
+    return str(error).startswith('MemoryError')  # raised in a worker, reported as text
 
-DATABASE = pm.Database()
-builder = pm.Builder()
+
+# PORMAKE, its database and the generation logger are initialized on first use, so that
+# importing the tools does not pay for them in sessions that never generate structures.
+# Build workers warm up their own caches once (`warm_up` as the supervisor initializer).
+
+@lru_cache(maxsize=None)
+def get_database() -> 'pm.Database':
+    import pormake as pm
+    pm.log.disable_print()
+    pm.log.disable_file_print()
+    return pm.Database()
+
+
+@lru_cache(maxsize=None)
+def get_builder() -> 'pm.Builder':
+    import pormake as pm
+    return pm.Builder()
+
+
+@lru_cache(maxsize=None)
+def get_topo(name: str) -> 'pm.Topology':
+    return get_database().get_topo(name)
+
+
+@lru_cache(maxsize=None)
+def get_bb(name: str) -> 'pm.BuildingBlock':
+    return get_database().get_bb(name)
+
+
+def warm_up(child_dict: Dict[str, List[str]]) -> None:
+    """Load the topologies and building blocks used by `child_dict` (in each build worker)"""
+    from moftransformer.utils.prepare_data import make_prepared_data
+
+    get_builder()
+    get_generate_logger()
+    for topology, cif_list in child_dict.items():
+        get_topo(topology)
+        for cif in cif_list:
+            for bb_name in cif.split('+'):
+                try:
+                    get_bb(bb_name)
+                except Exception:
+                    pass  # unknown building block : fails in the build
 
 
 def get_logger(filename):
@@ -33,35 +88,167 @@ def get_logger(filename):
     logger.addHandler(file_handler)
     return logger
 
-logger = get_logger(config['logger'])
+
+@lru_cache(maxsize=None)
+def get_generate_logger() -> logging.Logger:
+    return get_logger(config['logger'])
 
 
 class CIFGenerator(object):
-    def __init__(self, save_dir:str) -> None:
+    def __init__(
+        self, 
+        save_dir:str,
+        n_workers: Optional[int] = config.get('num_workers_generate'),
+        use_genome_store: bool = True,
+        prefilter: bool = True,
+        supervisor: Optional[BuildSupervisor] = None,
+    ) -> None:
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(exist_ok=True, parents=True)
+        self.n_workers = n_workers or os.cpu_count()
+        self.use_genome_store = use_genome_store
+        self.prefilter = prefilter
+        self.supervisor = supervisor  # shared, already running workers (owned by the caller)
         
     def run(
         self, 
         topology: str,
         cif_list: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        return self.run_all({topology: cif_list})[topology]
+
+    def run_all(
+        self,
+        child_dict: Dict[str, List[str]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """Build the children of every topology in supervised workers
+        (on `self.supervisor` if given, else on `n_workers` workers started for this call).
+        Children already in the genome store are restored (or skipped if known-bad).
+        Return the throughput report of each topology.
+        """
+        store = get_genome_store() if self.use_genome_store else None
+        features = get_bb_features(get_database()) if self.prefilter else None
+        jobs = []
+        reused = defaultdict(int)
+        skipped = defaultdict(int)
+        rejected = defaultdict(int)
+        for topology, cif_list in child_dict.items():
+            cif_list = list(dict.fromkeys(cif_list))  # drop duplicated children
+            if features is not None:
+                # reject incompatible building blocks in bulk, before any PORMAKE work
+                cif_list, rejected_list = features.prefilter(topology, cif_list)
+                rejected[topology] = len(rejected_list)
+
+            for cif in cif_list:
+                status = store.status(topology, cif) if store else None
+                if status == FAILED:
+                    skipped[topology] += 1
+                elif status == SUCCESS and store.restore(topology, cif, self.save_dir):
+                    reused[topology] += 1
+                else:
+                    jobs.append((topology, cif))
+
+        results = defaultdict(list)  # topology -> [(success, elapsed, finished)]
+        start = time.perf_counter()
+
+        child_jobs = defaultdict(list)
+        for topology, cif in jobs:
+            child_jobs[topology].append(cif)
+
+        # always in supervised workers (one with n_workers=1) : the wall-clock limit of a
+        # build is the supervisor's, which also works when this runs off the main thread
+        if self.supervisor is not None:
+            supervisor_context = contextlib.nullcontext(self.supervisor)
+        else:
+            supervisor_context = BuildSupervisor(
+                n_workers=max(self.n_workers, 1), initializer=partial(warm_up, dict(child_jobs))
+            )
+        with supervisor_context as supervisor:
+            args_ls = [(str(self.save_dir), topology, cif) for topology, cif in jobs]
+            outputs = supervisor.imap_unordered(_build_child, args_ls)
+            for (_, topology, cif), output in tqdm(outputs, total=len(jobs), desc='generate'):
+                if isinstance(output, BaseException):
+                    # killed, crashed or raised in the worker : remove partial outputs
+                    get_generate_logger().error(f'{topology}+{cif}: {output}')
+                    self._remove(self.save_dir/f'{topology}+{cif}.cif')
+                    success, elapsed = False, supervisor.timeout
+                    if not is_transient(output):
+                        self._record(store, topology, cif, success, error=str(output).split('\n')[0])
+                else:
+                    _, _, success, elapsed, structure = output
+                    if structure is not None:
+                        # parsed in the worker : shared with the visualizer and REPL of this process
+                        get_structure_cache().add(self.save_dir/f'{topology}+{cif}.cif', structure)
+                    self._record(store, topology, cif, success)
+                results[topology].append((success, elapsed, time.perf_counter() - start))
+
+        return {
+            topology: self._report(
+                results[topology], reused[topology], skipped[topology], rejected[topology]
+            ) 
+            for topology in child_dict
+        }
+
+    def _record(
+        self,
+        store: Optional[GenomeStore],
+        topology: str,
+        cif: str,
+        success: bool,
+        error: str = '',
     ) -> None:
-        topo = DATABASE.get_topo(topology)
+        if store is None:
+            return
+        if success:
+            store.add_success(topology, cif, self.save_dir/f'{topology}+{cif}.cif')
+        else:
+            store.add_failure(topology, cif, error)
 
-        for cif in tqdm(cif_list, desc=topology):
-            save_path = self.save_dir/f'{topology}+{cif}.cif'
-            success = self._run_cif(cif, topo, save_path)                      
+    @staticmethod
+    def _remove(save_path: Path) -> None:
+        for suffix in ['.cif', '.graphdata', '.grid', '.griddata16']:
+            save_path.with_suffix(suffix).unlink(missing_ok=True)
+
+    @staticmethod
+    def _report(
+        results: List[Tuple[bool, float, float]],
+        reused: int = 0,
+        skipped: int = 0,
+        rejected: int = 0,
+    ) -> Dict[str, Any]:
+        n_success = sum(success for success, _, _ in results)
+        build_time = sum(elapsed for _, elapsed, _ in results)
+        wall_time = max((finished for _, _, finished in results), default=0.)
+        mean_build_time = build_time / len(results) if results else 0.
+        return {
+            'total': len(results) + reused + skipped + rejected,
+            'success': n_success + reused,
+            'failed': len(results) - n_success + skipped + rejected,
+            'reused': reused,  # restored from the genome store
+            'skipped': skipped,  # known-bad in the genome store
+            'rejected': rejected,  # incompatible building blocks (prefilter)
+            'avoided_time': (skipped + rejected) * mean_build_time,  # estimated build seconds
+            'build_time': build_time,
+            'wall_time': wall_time,
+            'throughput': len(results) / wall_time if wall_time else 0.,  # structures / second
+        }
 
     def _run_cif(
             self,
             cif: str,
-            topo: pm.Topology,
+            topo: 'pm.Topology',
             save_path: Path,
-    ):
+    ) -> Tuple[bool, Optional[Structure]]:
+        """Build and prepare one child. The structure is the one just built in memory
+        (None when the CIF already existed or the build failed)"""
+        from moftransformer.utils.prepare_data import make_prepared_data
+        logger = get_generate_logger()
+        structure = None
         try:
             if not save_path.exists():
                 current_cif = self._generate_cif(cif, topo)
                 current_cif.write_cif(str(save_path))
+                structure = Structure.from_atoms(current_cif.atoms)
 
             is_success = make_prepared_data(
                 save_path, 
@@ -72,25 +259,28 @@ class CIFGenerator(object):
 
             if not is_success:
                 save_path.unlink()
-                return False
+                return False, None
             else:
-                return True
+                return True, structure
             
+        except MemoryError:
+            # transient : reported to the caller instead of being recorded as a failed child
+            save_path.unlink(missing_ok=True)
+            raise
         except Exception as e:
             if save_path.exists():
                 save_path.unlink()
             logger.error(e)
-            return False
+            return False, None
 
-    @timeout(30) # timeout set to 30 second
     def _generate_cif(
         self,
         cif: str,
-        topo: pm.Topology,
+        topo: 'pm.Topology',
     ):
         bb_name1, bb_name2 = cif.split('+')
-        bb1 = DATABASE.get_bb(bb_name1)
-        bb2 = DATABASE.get_bb(bb_name2)
+        bb1 = get_bb(bb_name1)
+        bb2 = get_bb(bb_name2)
 
         # No metal cluster or more than 2 metal cluster
         if (bb1.has_metal and bb2.has_metal) or (not bb1.has_metal and not bb2.has_metal):
@@ -108,9 +298,22 @@ class CIFGenerator(object):
             current_nodes[1] = bb2
             current_edges = {}
 
-        current_mof = builder.build_by_type(topo, current_nodes, current_edges)
+        current_mof = get_builder().build_by_type(topo, current_nodes, current_edges)
         return current_mof
 
 
-
-
+def _build_child(
+        save_dir: str,
+        topology: str,
+        cif: str,
+) -> Tuple[str, str, bool, float, Optional[Structure]]:
+    """Build one child and prepare its input data (runs in worker processes).
+    The compact structure of the built framework is returned, so that neither the worker
+    nor the parent parses the CIF again.
+    """
+    start = time.perf_counter()
+    generator = CIFGenerator(save_dir, n_workers=1, use_genome_store=False, prefilter=False)
+    topo = get_topo(topology)
+    save_path = generator.save_dir/f'{topology}+{cif}.cif'
+    success, structure = generator._run_cif(cif, topo, save_path)
+    return topology, cif, success, time.perf_counter() - start, structure
@@ -8,6 +8,7 @@ from langchain.callbacks.manager import CallbackManagerForChainRun
 
 from chatmof.config import config
 from chatmof.tools.genetic_algorithm.prompt import GENETIC_PROMPT
+from revised_tools.llm_cache import CachedLLMChain, get_prompt_cache
 
 
 class GeneticAlgorithmChain(Chain):
@@ -96,5 +97,5 @@ class GeneticAlgorithmChain(Chain):
             input_variables=['question', 'parents'],
             template=prompt,
         )
-        llm_chain = LLMChain(llm=llm, prompt=prompt)
+        llm_chain = CachedLLMChain(llm=llm, prompt=prompt, prompt_cache=get_prompt_cache())
         return cls(llm_chain=llm_chain, **kwargs)
\ No newline at end of file
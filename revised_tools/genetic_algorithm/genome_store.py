@@ -0,0 +1,116 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from chatmof.config import config
+
+
+_SUFFIXES = ['.cif', '.graphdata', '.grid', '.griddata16']
+
+SUCCESS = 'success'
+FAILED = 'failed'
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    if dst.exists():
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class GenomeStore(object):
+    """Content-addressed store of GA children keyed by (topology, bb1, bb2).
+
+    Keeps the built CIF and its prepared inputs (.graphdata, .grid, .griddata16) and
+    whether the build succeeded, so that a child which reappears in a later cycle or
+    property run is restored instead of rebuilt, and known-bad combinations are
+    skipped. Only deterministic build failures are stored. Predictions of restored
+    children are served by the PredictionCache of the runner (same prepared inputs,
+    same checkpoint). Status lookups are O(1) from memory.
+    """
+    def __init__(
+        self,
+        store_dir: str = config.get(
+            'genome_store_dir', os.path.join(config['generate_dir'], 'genomes')
+        ),
+    ) -> None:
+        self.store_dir = Path(store_dir)
+        self.file_dir = self.store_dir/'files'
+        self.file_dir.mkdir(exist_ok=True, parents=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.store_dir/'genomes.sqlite'), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS genomes ('
+                'key TEXT PRIMARY KEY, topology TEXT, bb1 TEXT, bb2 TEXT, '
+                'status TEXT, error TEXT, updated REAL)'
+            )
+            rows = self._conn.execute('SELECT key, status FROM genomes').fetchall()
+        self._status: Dict[str, str] = dict(rows)
+
+    @staticmethod
+    def key(topology: str, cif: str) -> str:
+        bb1, bb2 = cif.split('+')
+        return f'{topology}+{bb1}+{bb2}'
+
+    def status(self, topology: str, cif: str) -> Optional[str]:
+        return self._status.get(self.key(topology, cif))
+
+    def _upsert(self, key: str, **values: Any) -> None:
+        topology, bb1, bb2 = key.split('+')
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO genomes (key, topology, bb1, bb2) '
+                'VALUES (?, ?, ?, ?)', (key, topology, bb1, bb2)
+            )
+            columns = ', '.join(f'{name} = ?' for name in [*values, 'updated'])
+            self._conn.execute(
+                f'UPDATE genomes SET {columns} WHERE key = ?', (*values.values(), time.time(), key)
+            )
+
+    def add_success(self, topology: str, cif: str, save_path: Path) -> None:
+        key = self.key(topology, cif)
+        for suffix in _SUFFIXES:
+            src = Path(save_path).with_suffix(suffix)
+            if src.exists():
+                _link_or_copy(src, self.file_dir/f'{key}{suffix}')
+        self._upsert(key, status=SUCCESS, error=None)
+        self._status[key] = SUCCESS
+
+    def add_failure(self, topology: str, cif: str, error: str = '') -> None:
+        key = self.key(topology, cif)
+        self._upsert(key, status=FAILED, error=str(error))
+        self._status[key] = FAILED
+
+    def restore(self, topology: str, cif: str, save_dir: Path) -> bool:
+        """link the stored CIF and prepared inputs into `save_dir`"""
+        key = self.key(topology, cif)
+        files = [self.file_dir/f'{key}{suffix}' for suffix in _SUFFIXES]
+        if self._status.get(key) != SUCCESS or not all(f.exists() for f in files):
+            return False
+        for f in files:
+            _link_or_copy(f, Path(save_dir)/f.name)
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        values = list(self._status.values())
+        return {SUCCESS: values.count(SUCCESS), FAILED: values.count(FAILED)}
+
+
+_STORE: Optional[GenomeStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_genome_store() -> GenomeStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = GenomeStore()
+        return _STORE
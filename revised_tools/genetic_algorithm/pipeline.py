@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import contextlib
+from pathlib import Path
+from collections import defaultdict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+from langchain.callbacks.manager import CallbackManagerForChainRun
+
+from chatmof.config import config
+from revised_tools.genetic_algorithm.cif_generate import CIFGenerator, warm_up
+from revised_tools.genetic_algorithm.supervisor import BuildSupervisor
+
+
+def _run_coroutine(coroutine):
+    """asyncio.run, also when the caller already runs an event loop (e.g. a notebook)"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+class TopologyPipeline(object):
+    """Run one GA cycle with every topology moving through
+    search -> propose -> build -> predict on its own.
+
+    LLM stages (search, propose) of all topologies run concurrently. The build stage
+    is queued on the CIF build workers (one topology at a time, using every core) and
+    the predict stage on a single prediction thread, so CPU-bound stages of one
+    topology overlap with LLM I/O of the others. The build workers are started (and
+    warmed up) once per cycle and reused by every topology.
+    """
+    def __init__(
+        self,
+        generator: 'Generator',
+        run_manager: CallbackManagerForChainRun,
+        n_llm_workers: int = 8,
+    ) -> None:
+        self.generator = generator
+        self.run_manager = run_manager
+        self.n_llm_workers = n_llm_workers
+        self.timings: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+    @contextlib.contextmanager
+    def _timer(self, topology: str, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[topology][stage] = elapsed
+            self.generator._write_log(f'{topology} {stage}', f'{elapsed:.1f} s', self.run_manager)
+
+    async def _run_topology(
+        self,
+        topology: str,
+        df: pd.DataFrame,
+        output: Dict[str, str],
+        direc: Path,
+        information: str,
+    ) -> Optional[pd.DataFrame]:
+        loop = asyncio.get_running_loop()
+        generator = self.generator
+
+        with self._timer(topology, 'search'):
+            parents = await loop.run_in_executor(
+                self._llm_executor, generator._search_parents,
+                df, output, information, self.run_manager
+            )
+        if not parents:
+            return None
+        self._has_parents = True
+
+        with self._timer(topology, 'propose'):
+            children = await loop.run_in_executor(
+                self._llm_executor, generator._propose_children,
+                parents, output, self.run_manager
+            )
+
+        with self._timer(topology, 'build'):
+            report = await loop.run_in_executor(
+                self._build_executor, CIFGenerator(direc, supervisor=self._supervisor).run,
+                topology, children
+            )
+        generator._write_log(
+            f'Generate {topology}',
+            '{success}/{total} structures ({reused} reused, {skipped} known-bad, {rejected} rejected), '
+            '{throughput:.2f} structures/s, ~{avoided_time:.0f} s of build avoided'.format(**report),
+            self.run_manager
+        )
+
+        with self._timer(topology, 'predict'):
+            try:
+                df_gen, _ = await loop.run_in_executor(
+                    self._predict_executor, generator.run_predictor,
+                    output['Property'], topology, direc
+                )
+            except ValueError:
+                return None
+        return df_gen
+
+    async def _run(
+        self,
+        df_dict: Dict[str, pd.DataFrame],
+        output: Dict[str, str],
+        direc: Path,
+        information: str,
+    ) -> Dict[str, pd.DataFrame]:
+        topologies = [topo for topo in self.generator.topologies if topo in df_dict]
+        results = await asyncio.gather(*[
+            self._run_topology(topo, df_dict[topo], output, direc, information)
+            for topo in topologies
+        ])
+        return {topo: df for topo, df in zip(topologies, results) if df is not None}
+
+    def run(
+        self,
+        df_dict: Dict[str, pd.DataFrame],
+        output: Dict[str, str],
+        direc: Path,
+        information: str,
+    ) -> Dict[str, pd.DataFrame]:
+        """Return the predicted children of each topology"""
+        self._has_parents = False
+
+        n_workers = config.get('num_workers_generate') or os.cpu_count()
+        # PORMAKE and the topologies are loaded once per worker, not per topology
+        topologies = {topo: [] for topo in self.generator.topologies if topo in df_dict}
+        self._supervisor = BuildSupervisor(
+            n_workers=n_workers, initializer=partial(warm_up, topologies)
+        ).start()
+
+        self._llm_executor = ThreadPoolExecutor(max_workers=self.n_llm_workers)
+        self._build_executor = ThreadPoolExecutor(max_workers=1)
+        self._predict_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            df_gen_dict = _run_coroutine(self._run(df_dict, output, direc, information))
+        finally:
+            self._llm_executor.shutdown()
+            self._build_executor.shutdown()
+            self._predict_executor.shutdown()
+            self._supervisor.close()
+
+        if not self._has_parents:
+            raise ValueError('There are no parents')
+        return df_gen_dict
+
+    def stage_times(self) -> pd.DataFrame:
+        return pd.DataFrame(self.timings).T
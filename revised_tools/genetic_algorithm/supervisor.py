@@ -0,0 +1,241 @@
+import os
+import time
+import resource
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from chatmof.config import config
+
+
+class BuildTimeoutError(Exception):
+    pass
+
+
+class WorkerDiedError(Exception):
+    pass
+
+
+def _address_space() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return 0
+
+
+def _worker_loop(
+    conn: Connection,
+    memory_limit: Optional[int],
+    max_jobs: int,
+    initializer: Optional[Callable] = None,
+) -> None:
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception:
+            traceback.print_exc()  # a cold worker still builds
+    if memory_limit:
+        # limit what the build allocates on top of the warmed-up worker
+        limit = _address_space() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    conn.send(None)  # ready : the warm-up does not count against the first job's timeout
+
+    for _ in range(max_jobs):
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        job_id, func, args = task
+        try:
+            conn.send((job_id, True, func(*args)))
+        except BaseException as e:  # MemoryError included
+            conn.send((job_id, False, f'{type(e).__name__}: {e}\n{traceback.format_exc()}'))
+    # exit after `max_jobs` : the supervisor starts a fresh worker
+
+
+class _Worker(object):
+    """A build process with its own pipe. Killing the worker (even while it sends)
+    can only break this pipe, which is discarded with the worker."""
+    def __init__(self, ctx, memory_limit, max_jobs, initializer=None) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_loop,
+            args=(child_conn, memory_limit, max_jobs, initializer),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.n_jobs = 0
+        self.max_jobs = max_jobs
+        self.job: Optional[Tuple[int, float]] = None  # (job_id, start time)
+
+    @property
+    def retiring(self) -> bool:
+        return self.n_jobs >= self.max_jobs
+
+    def submit(self, job_id: int, func: Callable, args: Tuple) -> None:
+        self.conn.send((job_id, func, args))
+        self.job = (job_id, time.monotonic())
+        self.n_jobs += 1
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self) -> None:
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=1)
+        self.kill()
+
+
+class BuildSupervisor(object):
+    """Run structure builds in killable worker processes.
+
+    Each job is bounded by a wall-clock `timeout` (the worker is killed and replaced)
+    and by `memory_limit` bytes of address space on top of the warmed-up worker
+    (RLIMIT_AS). Workers are recycled after `max_jobs_per_worker` jobs so that memory
+    leaked by PORMAKE or the energy-grid calculation does not accumulate over a long run.
+
+    Workers, including replacements started mid-run, come from a forkserver : they are
+    never forked from the (multithreaded) caller. `initializer` runs once in each worker.
+    """
+    def __init__(
+        self,
+        n_workers: int = os.cpu_count(),
+        timeout: float = config.get('build_timeout', 60),
+        memory_limit: Optional[int] = config.get('build_memory_limit', 8 * 1024 ** 3),
+        max_jobs_per_worker: int = config.get('build_jobs_per_worker', 50),
+        initializer: Optional[Callable] = None,
+    ) -> None:
+        self.n_workers = n_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.initializer = initializer
+
+        self._ctx = mp.get_context('forkserver')
+        self._ctx.set_forkserver_preload(['revised_tools.genetic_algorithm.cif_generate'])
+        self._workers: Dict[int, _Worker] = {}
+        self._next_worker_id = 0
+
+        self.n_timeout = 0
+        self.n_died = 0
+        self.n_recycled = 0
+
+    def __enter__(self) -> 'BuildSupervisor':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _spawn(self) -> _Worker:
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        worker = _Worker(self._ctx, self.memory_limit, self.max_jobs_per_worker, self.initializer)
+        self._workers[worker_id] = worker
+        return worker
+
+    def start(self) -> 'BuildSupervisor':
+        """start the workers now (e.g. to warm them up before the first jobs)"""
+        while len(self._workers) < self.n_workers:
+            self._spawn()
+        return self
+
+    def _replace(self, worker_id: int) -> None:
+        self._workers.pop(worker_id).kill()
+        self._spawn()
+
+    def imap_unordered(
+        self,
+        func: Callable,
+        jobs: List[Tuple],
+    ) -> Iterator[Tuple[Tuple, Any]]:
+        """Yield (args, result) as jobs complete. `result` is an exception for failed jobs"""
+        pending = list(enumerate(jobs))[::-1]
+        running: Dict[int, int] = {}  # job_id -> worker_id
+        self.start()
+
+        while pending or running:
+            for worker_id, worker in list(self._workers.items()):
+                if worker.ready and worker.job is None and pending:
+                    if worker.retiring:
+                        self.n_recycled += 1
+                        self._replace(worker_id)
+                        continue
+                    job_id, args = pending.pop()
+                    worker.submit(job_id, func, args)
+                    running[job_id] = worker_id
+
+            for job_id, result in self._collect(running, block=True):
+                yield jobs[job_id], result
+
+            now = time.monotonic()
+            for worker_id, worker in list(self._workers.items()):
+                if not worker.ready and not worker.process.is_alive():
+                    self.n_died += 1  # died while warming up : no job lost
+                    self._replace(worker_id)
+                    continue
+                if worker.job is None:
+                    continue
+                job_id, started = worker.job
+                if now - started > self.timeout:
+                    self.n_timeout += 1
+                    error = BuildTimeoutError(f'build exceeded {self.timeout} s')
+                elif not worker.process.is_alive():
+                    # a finished worker flushes its result before exiting
+                    for done_id, result in self._collect(running, block=False):
+                        yield jobs[done_id], result
+                    if worker.job is None:
+                        continue
+                    self.n_died += 1
+                    error = WorkerDiedError(f'worker died (exitcode {worker.process.exitcode})')
+                else:
+                    continue
+                running.pop(job_id, None)
+                self._replace(worker_id)
+                yield jobs[job_id], error
+
+    def _collect(self, running: Dict[int, int], block: bool) -> List[Tuple[int, Any]]:
+        busy = {
+            worker.conn: worker_id
+            for worker_id, worker in self._workers.items()
+            if worker.job is not None or not worker.ready
+        }
+        done = []
+        for conn in wait(list(busy), timeout=0.1 if block else 0):
+            worker_id = busy[conn]
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                continue  # broken pipe of a dead worker : replaced by the liveness check
+            if message is None:
+                self._workers[worker_id].ready = True
+                continue
+            job_id, ok, result = message
+            if running.pop(job_id, None) is not None:
+                self._workers[worker_id].job = None
+                done.append((job_id, result if ok else RuntimeError(result)))
+        return done
+
+    def close(self) -> None:
+        for worker in self._workers.values():
+            worker.close()
+        self._workers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'timeout': self.n_timeout,
+            'died': self.n_died,
+            'recycled': self.n_recycled,
+        }
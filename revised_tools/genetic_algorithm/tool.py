@@ -5,7 +5,7 @@ from langchain.tools import Tool
 from langchain.base_language import BaseLanguageModel
 from langchain.tools.base import BaseTool
 from chatmof import __root_dir__
-from revised_tools.genetic_algorithm.base import Generator
+from revised_tools.lazy import LazyChain
 
 
 def _get_generator(
@@ -20,5 +20,10 @@ def _get_generator(
             "`generator` must only be used when the original question wants to generate. "
             "input must be provided in the form of a full sentence. "
         ),
-        func=Generator.from_llm(llm=llm, verbose=verbose).run,
-    )
\ No newline at end of file
+        func=LazyChain(lambda: _load_generator(llm=llm, verbose=verbose)),
+    )
+
+
+def _load_generator(llm: BaseLanguageModel, verbose: bool = False):
+    from revised_tools.genetic_algorithm.base import Generator
+    return Generator.from_llm(llm=llm, verbose=verbose)
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""Import-time profile of the ChatMOF online demo (python -X importtime)."""
+import re
+import sys
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+HEAVY_MODULES = [
+    'torch', 'pytorch_lightning', 'moftransformer', 'pormake', 'ase', 'matplotlib',
+]
+
+
+def import_profile(statement: str, cwd: str = '.') -> Dict[str, Tuple[float, float]]:
+    """Run `statement` in a fresh interpreter and return
+    {top-level package: (self time, cumulative time)} in seconds
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    self_time = defaultdict(float)
+    cumulative = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        m = re.match(r'import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)', line)
+        if not m:
+            continue
+        us_self, us_cumul, indent, module = m.groups()
+        package = module.split('.')[0]
+        self_time[package] += int(us_self) / 1e6
+        if len(indent) == 1:  # top-level import of the statement
+            cumulative[package] += int(us_cumul) / 1e6
+    return {pkg: (self_time[pkg], cumulative.get(pkg, 0.)) for pkg in self_time}
+
+
+def report(statement: str, top: int = 20, cwd: str = '.') -> str:
+    profile = import_profile(statement, cwd=cwd)
+    rows: List[Tuple[str, float, float]] = sorted(
+        ((pkg, s, c) for pkg, (s, c) in profile.items()), key=lambda x: -x[1]
+    )
+    total = sum(s for _, s, _ in rows)
+    heavy = [pkg for pkg in HEAVY_MODULES if pkg in profile]
+
+    lines = [f'$ {statement}', f'total import time: {total:.2f} s', '',
+             f'{"package":<24s}{"self (s)":>10s}{"top-level (s)":>15s}']
+    for pkg, s, c in rows[:top]:
+        lines.append(f'{pkg:<24s}{s:>10.3f}{c:>15.3f}')
+    lines.append('')
+    lines.append(f'heavy modules loaded: {", ".join(heavy) or "none"}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # cold start of the online demo : building every tool without running any of them
+    statement = (
+        'from langchain.llms.fake import FakeListLLM; '
+        'from revised_tools.tool_utils import load_chatmof_tools_revised; '
+        'load_chatmof_tools_revised(FakeListLLM(responses=[""]))'
+    )
+    print (report(sys.argv[1] if len(sys.argv) > 1 else statement))
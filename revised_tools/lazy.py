@@ -0,0 +1,29 @@
+import threading
+from typing import Any, Callable, Optional
+
+from langchain.chains.base import Chain
+
+
+class LazyChain(object):
+    """Stands in for `chain.run` of a tool. The chain (and the heavy modules it
+    imports) is only built by `factory` on the first invocation.
+    """
+    def __init__(self, factory: Callable[[], Chain]) -> None:
+        self._factory = factory
+        self._chain: Optional[Chain] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._chain is not None
+
+    @property
+    def chain(self) -> Chain:
+        if self._chain is None:
+            with self._lock:
+                if self._chain is None:
+                    self._chain = self._factory()
+        return self._chain
+
+    def __call__(self, *args: Any, callbacks: Any = None, **kwargs: Any) -> str:
+        return self.chain.run(*args, callbacks=callbacks, **kwargs)
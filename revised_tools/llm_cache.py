@@ -0,0 +1,216 @@
+import os
+import time
+import json
+import logging
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from langchain.chains.llm import LLMChain
+from langchain.callbacks.manager import CallbackManagerForChainRun
+from langchain.schema import Generation, LLMResult, PromptValue
+
+from chatmof import __root_dir__
+from chatmof.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCache(object):
+    """On-disk (SQLite) cache of LLM generations.
+
+    Rows are keyed by the identifying parameters of the LLM (model, temperature, ...),
+    the stop words and the rendered prompt. Rows older than `ttl` seconds are
+    treated as misses, and the least recently used rows are dropped above `max_rows`.
+    """
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = config.get('llm_cache_ttl', 7 * 24 * 3600),
+        max_rows: int = config.get('llm_cache_size', 100_000),
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.ttl = ttl
+        self.max_rows = max_rows
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS generations ('
+                'key TEXT PRIMARY KEY, llm TEXT, texts TEXT, created REAL, last_access REAL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_last_access ON generations (last_access)'
+            )
+
+    @staticmethod
+    def llm_string(llm) -> str:
+        params = dict(llm._identifying_params)
+        return json.dumps({'_type': llm._llm_type, **params}, sort_keys=True, default=str)
+
+    @staticmethod
+    def key(llm_string: str, prompt: PromptValue, stop: Optional[List[str]] = None) -> str:
+        hasher = hashlib.sha256(llm_string.encode())
+        hasher.update(json.dumps(stop).encode())
+        hasher.update(prompt.to_string().encode())
+        return hasher.hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[str]]:
+        """return {key: generated texts} for cached keys"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i: i+500]
+                rows = self._conn.execute(
+                    'SELECT key, texts, created FROM generations '
+                    f'WHERE key IN ({",".join("?"*len(chunk))})', chunk
+                ).fetchall()
+                found.update({
+                    key: json.loads(texts) for key, texts, created in rows
+                    if self.ttl is None or now - created <= self.ttl
+                })
+
+            if found:
+                with self._conn:
+                    self._conn.executemany(
+                        'UPDATE generations SET last_access = ? WHERE key = ?',
+                        [(now, key) for key in found]
+                    )
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, llm_string: str, rows: Dict[str, List[str]]) -> None:
+        """rows : {key: generated texts}"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?)',
+                [(key, llm_string, json.dumps(texts), now, now) for key, texts in rows.items()]
+            )
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock, self._conn:
+            if self.ttl is not None:
+                self._conn.execute(
+                    'DELETE FROM generations WHERE created < ?', (time.time() - self.ttl,)
+                )
+            n_rows, = self._conn.execute('SELECT COUNT(*) FROM generations').fetchone()
+            if n_rows <= self.max_rows:
+                return
+            # drop the least recently used rows (10% headroom to avoid evicting on every put)
+            n_evict = n_rows - int(self.max_rows * 0.9)
+            self._conn.execute(
+                'DELETE FROM generations WHERE rowid IN '
+                '(SELECT rowid FROM generations ORDER BY last_access LIMIT ?)', (n_evict,)
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM generations')
+
+    def __len__(self) -> int:
+        with self._lock:
+            n_rows, = self._conn.execute('SELECT COUNT(*) FROM generations').fetchone()
+        return n_rows
+
+    def stats(self) -> Dict[str, Any]:
+        n_calls = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / n_calls if n_calls else 0.,
+            'rows': len(self),
+            'max_rows': self.max_rows,
+            'ttl': self.ttl,
+        }
+
+
+_CACHES: Dict[str, Optional[PromptCache]] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_prompt_cache(
+    path: Optional[str] = config.get(
+        'llm_cache', os.path.join(__root_dir__, 'database/cache/llm.sqlite')
+    ),
+) -> Optional[PromptCache]:
+    """Process-wide cache of `path` (None: caching disabled, or `path` is not writable)"""
+    if path is None:
+        return None
+    path = os.path.abspath(path)
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            try:
+                _CACHES[path] = PromptCache(path)
+            except (OSError, sqlite3.Error) as e:
+                # e.g. read-only install : the chains run without a cache
+                logger.warning(f'LLM cache disabled ({path}): {e}')
+                _CACHES[path] = None
+        return _CACHES[path]
+
+
+class CachedLLMChain(LLMChain):
+    """LLMChain that answers repeated prompts from a PromptCache.
+
+    Only deterministic calls (temperature 0) are cached, so sampling at a higher
+    temperature still returns fresh generations.
+    """
+    prompt_cache: Optional[PromptCache] = None
+
+    def _cacheable(self) -> bool:
+        return self.prompt_cache is not None and not getattr(self.llm, 'temperature', 0)
+
+    def generate(
+        self,
+        input_list: List[Dict[str, Any]],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> LLMResult:
+        if not self._cacheable():
+            return super().generate(input_list, run_manager=run_manager)
+
+        prompts, stop = self.prep_prompts(input_list, run_manager=run_manager)
+        llm_string = self.prompt_cache.llm_string(self.llm)
+        keys = [self.prompt_cache.key(llm_string, prompt, stop) for prompt in prompts]
+        try:
+            cached = self.prompt_cache.get_many(keys)
+        except sqlite3.Error as e:  # locked or corrupted database : plain LLM call
+            logger.warning(f'LLM cache read failed: {e}')
+            cached = {}
+
+        llm_output = None
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            result = self.llm.generate_prompt(
+                [prompts[i] for i in missing],
+                stop,
+                callbacks=run_manager.get_child() if run_manager else None,
+            )
+            generated = {
+                keys[i]: [generation.text for generation in generations]
+                for i, generations in zip(missing, result.generations)
+            }
+            try:
+                self.prompt_cache.put_many(llm_string, generated)
+            except sqlite3.Error as e:
+                logger.warning(f'LLM cache write failed: {e}')
+            cached.update(generated)
+            llm_output = result.llm_output
+
+        return LLMResult(
+            generations=[[Generation(text=text) for text in cached[key]] for key in keys],
+            llm_output=llm_output,
+        )
@@ -1,8 +1,10 @@
 import os
 import re
 from pathlib import Path
+from collections import defaultdict
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
+import pyarrow.parquet as pq
 
 from langchain.base_language import BaseLanguageModel
 from langchain.chains.base import Chain
@@ -16,10 +18,14 @@ from chatmof.config import config
 from chatmof.tools.search_csv.base import TableSearcher
 from revised_tools.predictor.utils import model_names, _predictable_properties
 from revised_tools.predictor.runner import MOFTransformerRunner
+from revised_tools.predictor.precompute import DEFAULT_TABLE, get_prediction_table
+from revised_tools.predictor.intent import IntentParser
+from revised_tools.predictor import query_plan
 from revised_tools.predictor.prompt import (
     PROMPT, FINAL_MARKDOWN_PROPMT
 )
 from revised_tools.error import ChatMOFOnlineError
+from revised_tools.llm_cache import CachedLLMChain, get_prompt_cache
 
 
 class Predictor(Chain):
@@ -30,6 +36,9 @@ class Predictor(Chain):
     final_single_chain: LLMChain
     model_dir: str= config['model_dir']
     data_dir: str = config['data_dir']
+    runner: Optional[MOFTransformerRunner] = None  # live inference (disabled in online-demo)
+    prediction_table: Optional[str] = DEFAULT_TABLE  # precomputed predictions of data_dir
+    intent_parser: Optional[IntentParser] = None  # rule-based plans of simple questions
     tool_names: str = model_names
     input_key: str = 'question'
     output_key: str = 'answer'
@@ -77,11 +86,17 @@ class Predictor(Chain):
         run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
         callbacks = run_manager.get_child()
 
-        llm_output = self.llm_chain.predict(
-            question=inputs[self.input_key],
-            callbacks=callbacks
-        )
-        output = self._parse_output(llm_output)
+        output = None
+        if self.intent_parser is not None:
+            output = self.intent_parser.parse(inputs[self.input_key], self.data_dir)
+        if output is None:
+            llm_output = self.llm_chain.predict(
+                question=inputs[self.input_key],
+                callbacks=callbacks
+            )
+            output = self._parse_output(llm_output)
+        else:
+            run_manager.on_text(f"\n[Predictor] Plan: rule-based (LLM call saved)", verbose=self.verbose)
         
         run_manager.on_text(f"\n[Predictor] Thought: ", verbose=self.verbose)
         run_manager.on_text(output['Thought'], verbose=self.verbose, color='yellow')
@@ -90,13 +105,21 @@ class Predictor(Chain):
 
         df_ls = []
         info_ls = []
+        live_props = defaultdict(list)  # material -> properties
         for prop, mat in zip(output['Property'], output['Materials']):
             run_manager.on_text(f"\n[Predictor] Property: ", verbose=self.verbose)
             run_manager.on_text(prop, verbose=self.verbose, color='yellow')
             run_manager.on_text(f"\n[Predictor] Materials: ", verbose=self.verbose)
             run_manager.on_text(f"{mat}\n", verbose=self.verbose, color='yellow')
 
-            if prop == 'CO2_henry_coefficient_298K' and mat == 'XEGKUR':
+            if (df := self._lookup(prop, mat)) is not None:
+                # precomputed table first; live inference only for generated or unknown structures
+                run_manager.on_text(f'lookup: {Path(self.prediction_table).name}\n')
+                df_ls.append(df)
+                info_ls.append(get_prediction_table(self.prediction_table).model_info.get(prop, {}))
+                continue
+
+            elif prop == 'CO2_henry_coefficient_298K' and mat == 'XEGKUR':
                 cif_id = ['XEGKUR_clean']
                 logits = [-3.62769]
                 model_info = {
@@ -118,39 +141,106 @@ class Predictor(Chain):
                 }
                 run_manager.on_text(f'load_model: O2_uptake/best.ckpt\n')
                 run_manager.on_text(f'Predicting Dataloader 0: 100% | ■■■■■■■■■■■■■■■■■■■■■■ | 1/1 [00:00<00:00]\n')
+            elif self.runner is not None:
+                live_props[mat].append(prop)
+                continue
             else:
                 raise ChatMOFOnlineError('ChatMOF online-demo does not support prediction task.  If you want use more toolkits, please use code on our github.')
 
             df = pd.DataFrame({'cif_id': cif_id, prop: logits})
             df_ls.append(df)
             info_ls.append(model_info)
-            
-        df_total = df_ls[0]
-        for df in df_ls[1:]:
-            df_total.merge(df, on='cif_id', how='outer')
+
+        # properties of the same materials share one pass over the inputs
+        for mat, props in live_props.items():
+            if '*' in mat:
+                # wildcard can cover the whole database : stream predictions to a parquet file
+                path, model_info = self.runner.run_to_file(props, mat)
+                df_ls.append(path)
+            else:
+                df, model_info = self.runner.run_many(props, mat)
+                df_ls.append(df)
+            info_ls.extend(model_info)
 
         information = f'Information of models : {info_ls}. If unit or condition are existed, you must include it in the final output.'
 
         run_manager.on_text(f"[Predictor] Final Thought: ", verbose=self.verbose)
         run_manager.on_text(output['Final Thought'], verbose=self.verbose, color='yellow')
-        
-        if len(df_total) < config['max_length_in_predictor']:
+
+        try:
+            final_output = self._final_answer(
+                df_ls, 
+                question=output['Final Thought'], 
+                information=information, 
+                run_manager=run_manager
+            )
+        finally:
+            for result in df_ls:
+                if isinstance(result, Path):
+                    result.unlink(missing_ok=True)
+            
+        return {self.output_key: final_output}
+
+    def _lookup(self, prop: str, mat: str) -> Optional[pd.DataFrame]:
+        table = get_prediction_table(self.prediction_table)
+        if table is None or not table.is_current(prop, Path(self.model_dir)/prop):
+            return None
+        return table.lookup([prop], mat)
+
+    def _final_answer(
+            self,
+            results: List[Union[pd.DataFrame, Path]],
+            question: str,
+            information: str,
+            run_manager: CallbackManagerForChainRun,
+    ) -> str:
+        if len(results) == 1 and isinstance(results[0], Path):
+            # only the row count is read until the table is actually needed
+            metadata = pq.ParquetFile(results[0]).metadata
+            n_rows = metadata.num_rows
+            columns = metadata.schema.names
+            df_total = None
+        else:
+            df_total = self._load_result(results[0])
+            for result in results[1:]:
+                df_total = df_total.merge(self._load_result(result), on='cif_id', how='outer')
+            n_rows = len(df_total)
+            columns = list(df_total.columns)
+
+        numeric = query_plan.numeric_columns(results[0] if df_total is None else df_total)
+        if plan := query_plan.parse_query(question, columns, numeric):
+            # top-k / threshold / range / closest / sort run locally : the LLM only phrases the answer
+            df_plan, summary = query_plan.execute(plan, results[0] if df_total is None else df_total)
+            run_manager.on_text(f"\n[Predictor] Query: {summary}\n", verbose=self.verbose)
+            final_output = self.final_single_chain.run(
+                table = df_plan.to_markdown(),
+                information=f'{information} The table is the result of the query: {summary}.',
+                question = question
+            )
+        elif n_rows < config['max_length_in_predictor']:
+            df_total = self._load_result(results[0]) if df_total is None else df_total
             final_output = self.final_single_chain.run(
                 table = df_total.to_markdown(),
                 information=information,
-                question = output['Final Thought']
+                question = question
             )
         else:
+            df_total = self._load_result(results[0]) if df_total is None else df_total
             searcher = TableSearcher.from_dataframe(
                 llm = self.llm,
                 dataframe = df_total, 
                 verbose = self.verbose
             )
-            final_output = searcher.run(question=output['Final Thought'],
+            final_output = searcher.run(question=question,
                                         information=information,
                                         run_manager=run_manager)
-            
-        return {self.output_key: final_output}
+        return final_output
+
+    @staticmethod
+    def _load_result(result: Union[pd.DataFrame, Path]) -> pd.DataFrame:
+        if isinstance(result, Path):
+            return pd.read_parquet(result, memory_map=True)
+        return result
 
     @classmethod
     def from_llm(
@@ -170,13 +260,15 @@ class Predictor(Chain):
             input_variables=['table', 'information', 'question']
         )
 
-        llm_chain = LLMChain(llm=llm, prompt=template)
-        final_single_chain = LLMChain(llm=llm, prompt=fs_template)
+        prompt_cache = get_prompt_cache()
+        llm_chain = CachedLLMChain(llm=llm, prompt=template, prompt_cache=prompt_cache)
+        final_single_chain = CachedLLMChain(llm=llm, prompt=fs_template, prompt_cache=prompt_cache)
 
         return cls(
             llm=llm,
             llm_chain=llm_chain, 
             final_single_chain=final_single_chain,
+            intent_parser=kwargs.pop('intent_parser', IntentParser()),
             **kwargs)
 
 
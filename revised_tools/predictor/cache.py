@@ -0,0 +1,224 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Optional, Union
+
+import pandas as pd
+
+from chatmof.config import config
+
+
+_PREPARED_SUFFIXES = ['.graphdata', '.grid', '.griddata16']
+
+
+def _file_digest(path: Path, hasher=None) -> 'hashlib._Hash':
+    hasher = hasher or hashlib.blake2b(digest_size=16)
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+class PredictionCache(object):
+    """On-disk (SQLite) cache of predicted values.
+
+    Rows are keyed by (property, checkpoint hash, prepared-input hash), so a prediction
+    is reused as long as neither the model nor the prepared inputs of the CIF change.
+    Checkpoint hashes are memoized by (mtime, size) and rows of a property are dropped
+    when its checkpoint in `model_dir` changes.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_rows: int = config.get('prediction_cache_size', 1_000_000),
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.max_rows = max_rows
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._input_hashes: Dict[Tuple[str, int, int], str] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'prop TEXT, model_hash TEXT, input_hash TEXT, cif_id TEXT, value TEXT, '
+                'last_access REAL, PRIMARY KEY (prop, model_hash, input_hash))'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_last_access ON predictions (last_access)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                'prop TEXT PRIMARY KEY, path TEXT, mtime_ns INTEGER, size INTEGER, hash TEXT)'
+            )
+
+    def model_hash(self, model_dir: Path) -> str:
+        model_dir = Path(model_dir)
+        prop = model_dir.name
+        p_model, = model_dir.glob('*.ckpt')
+        stat = p_model.stat()
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT path, mtime_ns, size, hash FROM checkpoints WHERE prop = ?', (prop,)
+            ).fetchone()
+        if row and row[:3] == (str(p_model), stat.st_mtime_ns, stat.st_size):
+            return row[3]
+
+        digest = _file_digest(p_model, hashlib.sha256()).hexdigest()
+        with self._lock, self._conn:
+            # checkpoint changed: invalidate every prediction of the old model
+            self._conn.execute(
+                'DELETE FROM predictions WHERE prop = ? AND model_hash != ?', (prop, digest)
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)',
+                (prop, str(p_model), stat.st_mtime_ns, stat.st_size, digest)
+            )
+        return digest
+
+    def input_hash(self, cif: Path) -> str:
+        cif = Path(cif)
+        files = [cif.with_suffix(suffix) for suffix in _PREPARED_SUFFIXES]
+        files = [f for f in files if f.exists()] or [cif]
+
+        stats = [f.stat() for f in files]
+        key = (str(cif), max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats))
+        if key not in self._input_hashes:
+            hasher = hashlib.blake2b(digest_size=16)
+            for f in files:
+                _file_digest(f, hasher)
+            self._input_hashes[key] = hasher.hexdigest()
+        return self._input_hashes[key]
+
+    def get_many(
+        self,
+        prop: str,
+        model_hash: str,
+        input_hashes: List[str],
+    ) -> Dict[str, Tuple[str, Any]]:
+        """return {input_hash: (cif_id, value)} for cached inputs"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(input_hashes), 500):
+                chunk = input_hashes[i: i+500]
+                rows = self._conn.execute(
+                    'SELECT input_hash, cif_id, value FROM predictions '
+                    f'WHERE prop = ? AND model_hash = ? AND input_hash IN ({",".join("?"*len(chunk))})',
+                    (prop, model_hash, *chunk)
+                ).fetchall()
+                found.update({h: (cif_id, json.loads(value)) for h, cif_id, value in rows})
+
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        'UPDATE predictions SET last_access = ? '
+                        'WHERE prop = ? AND model_hash = ? AND input_hash = ?',
+                        [(now, prop, model_hash, h) for h in found]
+                    )
+
+        self.hits += len(found)
+        self.misses += len(input_hashes) - len(found)
+        return found
+
+    def put_many(
+        self,
+        prop: str,
+        model_hash: str,
+        rows: List[Tuple[str, str, Any]],
+    ) -> None:
+        """rows : list of (input_hash, cif_id, value)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)',
+                [(prop, model_hash, h, cif_id, json.dumps(value), now) for h, cif_id, value in rows]
+            )
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock, self._conn:
+            n_rows, = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()
+            if n_rows <= self.max_rows:
+                return
+            # drop the least recently used rows (10% headroom to avoid evicting on every put)
+            n_evict = n_rows - int(self.max_rows * 0.9)
+            self._conn.execute(
+                'DELETE FROM predictions WHERE rowid IN '
+                '(SELECT rowid FROM predictions ORDER BY last_access LIMIT ?)', (n_evict,)
+            )
+
+    def warmup(
+        self,
+        table: Union[str, pd.DataFrame],
+        model_dir: str,
+        data_dir: str,
+        props: Optional[List[str]] = None,
+    ) -> int:
+        """Fill the cache from a precomputed table (cif_id + one column per property)"""
+        if isinstance(table, (str, Path)):
+            table = _read_table(table)
+
+        data_dir = Path(data_dir)
+        props = props or [c for c in table.columns if (Path(model_dir)/c).is_dir()]
+
+        n_rows = 0
+        for prop in props:
+            model_hash = self.model_hash(Path(model_dir)/prop)
+            rows = []
+            for cif_id, value in zip(table['cif_id'], table[prop]):
+                cif = data_dir/f'{cif_id}.cif'
+                if pd.isna(value) or not cif.exists():
+                    continue
+                value = value.item() if hasattr(value, 'item') else value
+                rows.append((self.input_hash(cif), cif_id, value))
+            self.put_many(prop, model_hash, rows)
+            n_rows += len(rows)
+        return n_rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            n_rows, = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()
+        return n_rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rows': len(self),
+            'max_rows': self.max_rows,
+        }
+
+
+def _read_table(path: str) -> pd.DataFrame:
+    suffix = Path(path).suffix
+    if suffix == '.csv':
+        return pd.read_csv(path)
+    elif suffix in ['.xlsx', '.xls']:
+        return pd.read_excel(path)
+    elif suffix == '.parquet':
+        return pd.read_parquet(path)
+    raise TypeError(f'table must be csv, xlsx or parquet, not {suffix}')
+
+
+_CACHES: Dict[str, PredictionCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_prediction_cache(path: str) -> PredictionCache:
+    path = os.path.abspath(path)
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            _CACHES[path] = PredictionCache(path)
+        return _CACHES[path]
@@ -0,0 +1,85 @@
+import time
+import logging
+from typing import Dict, Any, List
+from pathlib import Path
+from collections import defaultdict
+
+import torch
+from pytorch_lightning.utilities import move_data_to_device
+from moftransformer.modules import Module
+
+from revised_tools.predictor.utils import load_datamodule, predict
+from revised_tools.predictor.model_pool import get_model_pool
+
+
+def load_batches(
+        data_list: List[Path],
+        _config: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    dataloader = load_datamodule(data_list, _config)
+    return list(dataloader)
+
+
+def run_batches(
+        model: Module,
+        batches: List[Dict[str, Any]],
+) -> Dict[str, List[Any]]:
+    output = defaultdict(list)
+    with torch.inference_mode():
+        for batch_idx, batch in enumerate(batches):
+            batch = move_data_to_device(batch, model.device)
+            ret = model.predict_step(batch, batch_idx)
+            for key, value in ret.items():
+                output[key].extend(value)
+    return output
+
+
+def predict_direct(
+        data_list: List[Path],
+        model_dir: Path,
+        verbose: bool = False,
+        accelerator: str = 'cpu',
+) -> Dict[str, List[str]]:
+    """Same as `predict`, but runs the forward pass of the Module directly, on CPU
+    by default (no pl.Trainer, strategy selection or callbacks).
+    """
+    model, config = get_model_pool(model_dir.parent).get(model_dir.name, accelerator=accelerator)
+    batches = load_batches(data_list, config)
+    return run_batches(model, batches)
+
+
+def benchmark(
+        data_list: List[Path],
+        model_dir: Path,
+        repeat: int = 3,
+        accelerator: str = 'cpu',
+) -> Dict[str, float]:
+    """Latency per CIF (second) of the Trainer path and the direct path (warm models),
+    both on `accelerator`"""
+    logging.getLogger("pytorch_lightning").setLevel(logging.ERROR)
+
+    result = {}
+    for name, func in [('trainer', predict), ('direct', predict_direct)]:
+        func(data_list, model_dir, accelerator=accelerator)  # warm up model pool
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(data_list, model_dir, accelerator=accelerator)
+        elapsed = time.perf_counter() - start
+        result[name] = elapsed / repeat / len(data_list)
+
+    result['speedup'] = result['trainer'] / result['direct']
+    return result
+
+
+if __name__ == '__main__':
+    from chatmof.config import config
+    from revised_tools.predictor.runner import MOFTransformerRunner
+
+    runner = MOFTransformerRunner()
+    data_list = runner.parse_data('XEGKUR, JUKPAI, PITPEP')
+
+    for prop in ['bandgap', 'void_fraction']:
+        output = benchmark(data_list, Path(config['model_dir'])/prop)
+        print (f"{prop:>20s} | trainer: {output['trainer']*1000:.1f} ms/cif | "
+               f"direct: {output['direct']*1000:.1f} ms/cif | x{output['speedup']:.1f}")
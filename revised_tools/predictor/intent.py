@@ -0,0 +1,190 @@
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from chatmof.config import config
+from revised_tools.predictor.utils import _predictable_properties
+from revised_tools.predictor.material_index import get_material_index
+
+
+# phrases of the question -> property (the property names themselves are added below)
+ALIASES = {
+    'surface area': 'accessible_surface_area',
+    'accessible surface area': 'accessible_surface_area',
+    'non accessible surface area': 'nonaccessible_surface_area',
+    'band gap': 'bandgap',
+    'void fraction': 'void_fraction',
+    'porosity': 'void_fraction',
+    'accessible volume fraction': 'accessible_volume_volume_fraction',
+    'non accessible volume': 'nonaccessible_volume',
+    'pore limiting diameter': 'pore_limiting_diameter',
+    'pld': 'pore_limiting_diameter',
+    'largest cavity diameter': 'largest_cavity_diameter',
+    'lcd': 'largest_cavity_diameter',
+    'largest free pore diameter': 'largest_free_pore_diameter',
+    'lfpd': 'largest_free_pore_diameter',
+    'thermal stability': 'thermal_stability',
+    'solvent removal stability': 'solvent_removal_stability',
+    'co2 henry coefficient': 'CO2_henry_coefficient_298K',
+    'henry coefficient of co2': 'CO2_henry_coefficient_298K',
+    'hydrogen uptake': 'hydrogen_uptake_100bar_77K',
+    'h2 uptake': 'hydrogen_uptake_100bar_77K',
+    'oxygen uptake': 'oxygen_uptake_1bar_298K',
+    'o2 uptake': 'oxygen_uptake_1bar_298K',
+    'nitrogen uptake': 'nitrogen_uptake_1bar_298K',
+    'n2 uptake': 'nitrogen_uptake_1bar_298K',
+    'hydrogen diffusivity': 'hydrogen_diffusivity_dilute_77K',
+    'h2 diffusivity': 'hydrogen_diffusivity_dilute_77K',
+    'oxygen diffusivity': 'oxygen_diffusivity_dilute_298K',
+    'o2 diffusivity': 'oxygen_diffusivity_dilute_298K',
+    'nitrogen diffusivity': 'nitrogen_diffusivity_dilute_298K',
+    'n2 diffusivity': 'nitrogen_diffusivity_dilute_298K',
+}
+
+# words that do not change the plan of a single-material prediction
+FILLERS = {
+    'what', 'whats', 'what\'s', 'is', 'are', 'the', 'of', 'for', 'and', 'a', 'an', 'to',
+    'predict', 'prediction', 'predicted', 'estimate', 'calculate', 'compute', 'tell', 'me',
+    'give', 'value', 'values', 'how', 'much', 'does', 'do', 'can', 'you', 'please', 'its',
+    'at', 'in', 'with', 'find', 'show', 'get', 'mof', 'mofs', 'material', 'materials',
+    'structure', 'structures', 's', 'about', 'both', 'their', 'has', 'have', 'which', 'on',
+}
+
+# aggregation over many materials or a different task : always planned by the LLM
+REJECTS = {
+    'highest', 'lowest', 'top', 'max', 'maximum', 'min', 'minimum', 'most', 'least',
+    'best', 'worst', 'compare', 'compared', 'comparison', 'than', 'all', 'every', 'rank',
+    'sort', 'list', 'average', 'mean', 'topology', 'save', 'csv', 'file', 'plot',
+    'between', 'above', 'below', 'greater', 'less', 'over', 'under', 'not', 'generate',
+    'visualize', 'other', 'others',
+}
+
+_REFCODE = re.compile(r'\b[A-Z]{6}\d{0,2}\b')
+_CONDITION = re.compile(r'\b(\d+(?:\.\d+)?)\s*(k|bar|atm|kpa|pa)\b')  # '298k', '1 bar' (normalized text)
+_PROP_CONDITION = re.compile(r'(\d+(?:\.\d+)?)(K|bar)(?=_|$)')  # 'hydrogen_uptake_100bar_77K'
+_TO_BAR = {'bar': 1., 'atm': 1.01325, 'kpa': 1e-2, 'pa': 1e-5}
+
+
+def _property_conditions(prop: str) -> Dict[str, float]:
+    """fixed conditions of a model : {'bar': 100., 'k': 77.}"""
+    return {unit.lower(): float(value) for value, unit in _PROP_CONDITION.findall(prop)}
+
+
+def _question_conditions(text: str) -> List[Tuple[str, float]]:
+    """conditions written in the (normalized) question, pressures converted to bar"""
+    conditions = []
+    for value, unit in _CONDITION.findall(text):
+        if unit == 'k':
+            conditions.append(('k', float(value)))
+        else:
+            conditions.append(('bar', float(value) * _TO_BAR[unit]))
+    return conditions
+
+
+def _normalize(text: str) -> str:
+    text = re.sub(r'[-_/]', ' ', text.lower())
+    return re.sub(r'[^\w\s\']', ' ', text)
+
+
+class IntentParser(object):
+    """Rule/keyword parser of single-step prediction questions.
+
+    Properties are matched against the names of `_predictable_properties` and
+    `ALIASES`, materials against REFCODEs found in the material index. Only when every
+    word of the question is a property, a material, a matching condition or a filler is
+    the plan returned in the format of `Predictor._parse_output`, so the planning LLM
+    call is skipped. Otherwise `parse` returns None and the LLM plans as before.
+    """
+    def __init__(
+        self,
+        properties: List[str] = _predictable_properties,
+    ) -> None:
+        aliases = {prop.replace('_', ' ').lower(): prop for prop in properties}
+        aliases.update({k: v for k, v in ALIASES.items() if v in properties})
+        # longest phrase first : 'accessible surface area' before 'surface area'
+        self.aliases: List[Tuple[re.Pattern, str]] = [
+            (re.compile(rf'\b{re.escape(phrase)}\b'), prop)
+            for phrase, prop in sorted(aliases.items(), key=lambda t: -len(t[0]))
+        ]
+
+        self._lock = threading.Lock()
+        self.n_parsed = 0
+        self.n_fallback = 0
+
+    def _match_properties(self, text: str) -> Tuple[List[str], str]:
+        """Return the properties in order of appearance and the text without them"""
+        found = []
+        for pattern, prop in self.aliases:
+            for m in pattern.finditer(text):
+                found.append((m.start(), prop))
+            text = pattern.sub(' ', text)
+        props = []
+        for _, prop in sorted(found):
+            if prop not in props:
+                props.append(prop)
+        return props, text
+
+    def confidence(self, question: str, data_dir: str) -> Tuple[float, Optional[Dict[str, Any]]]:
+        materials = list(dict.fromkeys(_REFCODE.findall(question)))
+        text = _REFCODE.sub(' ', question)
+        props, text = self._match_properties(_normalize(text))
+        if not props or not materials:
+            return 0., None
+
+        index = get_material_index(data_dir)
+        if not all(index.search(f'{mat}*.cif') for mat in materials):
+            return 0., None
+
+        # a condition is only explained by a model trained at that condition
+        for unit, value in _question_conditions(text):
+            for prop in props:
+                fixed = _property_conditions(prop).get(unit)
+                if fixed is None or abs(fixed - value) > 0.02 * fixed:
+                    return 0., None
+        text = _CONDITION.sub(' ', text)
+
+        words = text.split()
+        if any(word in REJECTS for word in words):
+            return 0., None
+        unexplained = [w for w in words if w not in FILLERS]
+        n_words = len(words) + len(props) + len(materials)
+        score = 1 - len(unexplained) / n_words
+        if unexplained:
+            # 'and why', 'stability' : a single unexplained word may change the question
+            return score, None
+
+        mats = ', '.join(materials)
+        prop_names = ' and '.join(prop.replace('_', ' ') for prop in props)
+        return score, {
+            'Thought': f'I need to predict the {prop_names} of {mats}.',
+            'Property': props,
+            'Materials': [mats] * len(props),
+            'Final Thought': f'Based on the result, answer the question using the predicted {prop_names}.',
+        }
+
+    def parse(self, question: str, data_dir: str) -> Optional[Dict[str, Any]]:
+        """The plan of `question`, or None when the LLM has to plan it"""
+        score, output = self.confidence(question, data_dir)
+        with self._lock:
+            if output is not None:
+                self.n_parsed += 1
+                return output
+            self.n_fallback += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        n_calls = self.n_parsed + self.n_fallback
+        return {
+            'llm_calls_saved': self.n_parsed,
+            'llm_fallback': self.n_fallback,
+            'saved_rate': self.n_parsed / n_calls if n_calls else 0.,
+        }
+
+
+if __name__ == '__main__':
+    parser = IntentParser()
+    with open('questions.txt') as f:
+        for question in f:
+            output = parser.parse(question.strip(), config['data_dir'])
+            print (question.strip(), '->', output and output['Property'])
+    print (parser.stats())
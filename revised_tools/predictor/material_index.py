@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import time
+import bisect
+import hashlib
+import fnmatch
+import threading
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List, Union
+
+from chatmof import __root_dir__
+from chatmof.config import config
+from revised_tools.predictor.utils import search_file
+
+
+class MaterialIndex(object):
+    """Prebuilt index of the CIF files in `data_dir`.
+
+    Maps REFCODE (file stem), prefix and topology (`pcu+N1+E2` -> `pcu`) to paths.
+    The index is persisted to `index_dir` and refreshed incrementally when the mtime
+    of `data_dir` changes (a file was added, removed or renamed).
+    """
+    def __init__(
+        self,
+        data_dir: str,
+        index_dir: str = config.get('material_index_dir', os.path.join(__root_dir__, 'database/cache/')),
+    ) -> None:
+        self.data_dir = Path(data_dir)
+        key = hashlib.md5(str(self.data_dir.resolve()).encode()).hexdigest()[:16]
+        self.index_path = Path(index_dir)/f'material_index_{key}.json'
+
+        self._lock = threading.Lock()
+        self._mtime_ns = -1
+        self._names: List[str] = []  # sorted stems
+        self._name_set = set()
+        self._topologies: Dict[str, List[str]] = defaultdict(list)
+
+        self._load()
+        self.refresh()
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            with self.index_path.open() as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get('data_dir') != str(self.data_dir.resolve()):
+            return
+        self._mtime_ns = data['mtime_ns']
+        self._set_names(data['names'])
+
+    def _save(self) -> None:
+        try:
+            self.index_path.parent.mkdir(exist_ok=True, parents=True)
+            tmp = self.index_path.with_suffix('.tmp')
+            with tmp.open('w') as f:
+                json.dump({
+                    'data_dir': str(self.data_dir.resolve()),
+                    'mtime_ns': self._mtime_ns,
+                    'names': self._names,
+                }, f)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            pass  # read-only storage : keep the index in memory
+
+    def _set_names(self, names: List[str]) -> None:
+        self._names = sorted(names)
+        self._name_set = set(self._names)
+        self._topologies = defaultdict(list)
+        for name in self._names:
+            if '+' in name:
+                self._topologies[name.split('+', 1)[0]].append(name)
+
+    def refresh(self) -> bool:
+        """rescan `data_dir` only when its mtime changed. Return True if updated"""
+        try:
+            mtime_ns = self.data_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime_ns == self._mtime_ns:
+            return False
+
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return False
+
+            with os.scandir(self.data_dir) as it:
+                current = {e.name[:-4] for e in it if e.name.endswith('.cif')}
+
+            added = current - self._name_set
+            removed = self._name_set - current
+            if len(added) + len(removed) > 1000:
+                self._set_names(list(current))
+            else:
+                names = [name for name in self._names if name not in removed]
+                for name in added:
+                    bisect.insort(names, name)
+                self._set_names(names)
+
+            self._mtime_ns = mtime_ns
+            self._save()
+        return True
+
+    def exact(self, name: str) -> List[Path]:
+        if name in self._name_set:
+            return [self.data_dir/f'{name}.cif']
+        return []
+
+    def prefix(self, prefix: str) -> List[Path]:
+        start = bisect.bisect_left(self._names, prefix)
+        end = bisect.bisect_left(self._names, prefix + '\U0010ffff')
+        return [self.data_dir/f'{name}.cif' for name in self._names[start:end]]
+
+    def topology(self, topology: str) -> List[Path]:
+        return [self.data_dir/f'{name}.cif' for name in self._topologies.get(topology, [])]
+
+    def search(self, name: str) -> Union[List[Path], bool]:
+        """Same contract as `search_file(name, data_dir)`"""
+        name = name.strip()
+        if not name.endswith('.cif'):
+            return search_file(name, self.data_dir)
+
+        self.refresh()
+        stem = name[:-4]
+        if '*' not in stem:
+            return self.exact(stem) or False
+
+        if m := re.fullmatch(r'([^*?\[]*)\*', stem):
+            prefix = m.group(1)
+            if prefix.endswith('+') and prefix[:-1] in self._topologies:
+                return self.topology(prefix[:-1])
+            return self.prefix(prefix)
+
+        return [self.data_dir/f'{n}.cif' for n in fnmatch.filter(self._names, stem)]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+_INDEXES: Dict[str, MaterialIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_material_index(data_dir: str) -> MaterialIndex:
+    key = str(Path(data_dir).resolve())
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = MaterialIndex(data_dir)
+        return _INDEXES[key]
+
+
+def benchmark(
+        data_dir: str,
+        queries: List[str],
+        repeat: int = 10,
+) -> Dict[str, float]:
+    """Mean time per query (second) of `search_file` (glob) and the material index"""
+    index = get_material_index(data_dir)
+    result = {}
+    for name, func in [('glob', lambda q: search_file(q, Path(data_dir))), ('index', index.search)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                func(query)
+        result[name] = (time.perf_counter() - start) / repeat / len(queries)
+    result['speedup'] = result['glob'] / result['index']
+    return result
+
+
+if __name__ == '__main__':
+    queries = ['XEGKUR*.cif', 'JUKPAI*.cif', 'PITPEP*.cif', 'ZN*.cif', 'XEGKUR_clean.cif']
+    output = benchmark(config['data_dir'], queries)
+    print (f"glob: {output['glob']*1000:.3f} ms/query | index: {output['index']*1000:.4f} ms/query "
+           f"| x{output['speedup']:.0f}")
+
+    topo_queries = [f'{topo}*.cif' for topo in config['topologies']]
+    output = benchmark(config['hmof_dir'], topo_queries)
+    print (f"glob: {output['glob']*1000:.3f} ms/query | index: {output['index']*1000:.4f} ms/query "
+           f"| x{output['speedup']:.0f}")
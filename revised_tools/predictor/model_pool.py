@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Any, Tuple, Optional
+
+import torch
+from moftransformer.modules import Module
+
+from chatmof.config import config as default_config
+from revised_tools.predictor.utils import read_yaml, update_config
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_device(accelerator: str) -> torch.device:
+    if accelerator in ['cuda', 'gpu'] and torch.cuda.is_available():
+        return torch.device('cuda')
+    return torch.device('cpu')
+
+
+def _model_nbytes(model: torch.nn.Module) -> int:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _checkpoint(model_dir: Path) -> Tuple[str, int, int]:
+    """(path, mtime, size) of the checkpoint in `model_dir`"""
+    p_model, = model_dir.glob('*.ckpt')
+    stat = p_model.stat()
+    return str(p_model), stat.st_mtime_ns, stat.st_size
+
+
+class ModelPool(object):
+    """Process-wide registry of fine-tuned MOFTransformer models.
+
+    Each property model is loaded once per accelerator (hparams.yaml + *.ckpt), kept
+    in eval mode and evicted by LRU when the memory budget, shared by every accelerator,
+    is exceeded. A model is loaded again when its checkpoint is replaced.
+    """
+    def __init__(
+        self,
+        model_dir: str,
+        accelerator: str = default_config['accelerator'],
+        memory_budget: int = default_config.get('model_pool_budget', 4 * 1024 ** 3),
+    ) -> None:
+        self.model_dir = Path(model_dir)
+        self.accelerator = accelerator  # default accelerator of `get`
+        self.memory_budget = memory_budget
+
+        # (prop, accelerator) -> (model, config, nbytes, checkpoint)
+        self._models: 'OrderedDict[Tuple[str, str], Tuple[Module, Dict[str, Any], int, Tuple]]' = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.load_time = 0.0
+
+    def get(self, prop: str, accelerator: Optional[str] = None) -> Tuple[Module, Dict[str, Any]]:
+        key = (prop, accelerator or self.accelerator)
+        checkpoint = _checkpoint(self.model_dir/prop)
+        with self._lock:
+            if key in self._models:
+                model, _config, _, loaded = self._models[key]
+                if loaded == checkpoint:
+                    self.hits += 1
+                    self._models.move_to_end(key)
+                    return model, _config
+                # checkpoint replaced : drop the stale model of every accelerator
+                for stale in [k for k in self._models if k[0] == prop]:
+                    self._models.pop(stale)
+                self.reloads += 1
+                logger.info(f'checkpoint changed: {prop}')
+
+            self.misses += 1
+            model, _config = self._load(prop, key[1], checkpoint[0])
+            self._models[key] = (model, _config, _model_nbytes(model), checkpoint)
+            self._evict(keep=key)
+            return model, _config
+
+    def _load(self, prop: str, accelerator: str, p_model: str) -> Tuple[Module, Dict[str, Any]]:
+        start = time.perf_counter()
+
+        device = _get_device(accelerator)
+        _config = read_yaml(self.model_dir/prop/'hparams.yaml')
+        update_config(_config, Path(p_model))
+        _config['accelerator'] = accelerator
+
+        model = Module(_config)
+        model.to(device)
+        model.eval()
+
+        elapsed = time.perf_counter() - start
+        self.load_time += elapsed
+        logger.info(f'load model: {prop} ({elapsed:.2f}s, {device})')
+        return model, _config
+
+    def _evict(self, keep: Tuple[str, str]) -> None:
+        while self.memory_usage > self.memory_budget and len(self._models) > 1:
+            key = next(iter(self._models))
+            if key == keep:
+                break
+            self._models.pop(key)
+            self.evictions += 1
+            logger.info(f'evict model: {key[0]} ({key[1]})')
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(nbytes for _, _, nbytes, _ in self._models.values())
+
+    def __contains__(self, prop: str) -> bool:
+        return any(key[0] == prop for key in self._models)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'reloads': self.reloads,
+            'load_time': self.load_time,
+            'loaded': [f'{prop} ({accelerator})' for prop, accelerator in self._models],
+            'memory_usage': self.memory_usage,
+            'memory_budget': self.memory_budget,
+        }
+
+
+_POOLS: Dict[str, ModelPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_model_pool(model_dir: str = default_config['model_dir']) -> ModelPool:
+    """the pool of `model_dir`, shared by every accelerator (see `ModelPool.get`)"""
+    key = str(Path(model_dir).resolve())
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ModelPool(model_dir)
+        return _POOLS[key]
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from chatmof.config import config
+from revised_tools.predictor.utils import _predictable_properties
+from revised_tools.predictor.cache import _file_digest
+
+
+DEFAULT_TABLE = config.get(
+    'prediction_table',
+    os.path.join(os.path.dirname(config['lookup_dir']), 'predictions.parquet')
+)
+
+_CHECKPOINTS: Dict[Tuple[str, int, int], str] = {}  # (path, mtime, size) -> hash
+_CHECKPOINTS_LOCK = threading.Lock()
+
+
+def checkpoint_hash(model_dir: Path) -> Optional[str]:
+    """sha256 of the checkpoint in `model_dir` (same as `PredictionCache.model_hash`),
+    memoized by (mtime, size). None when the checkpoint is not available"""
+    p_models = list(Path(model_dir).glob('*.ckpt'))
+    if len(p_models) != 1:
+        return None
+    stat = p_models[0].stat()
+    key = (str(p_models[0]), stat.st_mtime_ns, stat.st_size)
+    with _CHECKPOINTS_LOCK:
+        if key not in _CHECKPOINTS:
+            _CHECKPOINTS[key] = _file_digest(p_models[0], hashlib.sha256()).hexdigest()
+        return _CHECKPOINTS[key]
+
+
+def precompute_table(
+        runner: 'MOFTransformerRunner',
+        props: List[str] = _predictable_properties,
+        material: str = '*',
+        path: str = DEFAULT_TABLE,
+) -> Path:
+    """Batch job : predict `props` for every material of `runner.data_dir` and store them
+    in a compressed parquet table (one row per cif_id, one column per property).
+    Information and checkpoint hash of each model are kept in the schema metadata.
+    """
+    model_info = {
+        prop: runner._load_model_info(Path(runner.model_dir)/prop) for prop in props
+    }
+    checkpoints = {
+        prop: checkpoint_hash(Path(runner.model_dir)/prop) for prop in props
+    }
+    metadata = {
+        b'model_info': json.dumps(model_info).encode(),
+        b'checkpoints': json.dumps(checkpoints).encode(),
+    }
+
+    path = Path(path)
+    tmp = path.with_suffix('.tmp')
+    writer = None
+    try:
+        for df in runner.run_stream(props, material):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                schema = table.schema.with_metadata(metadata)
+                writer = pq.ParquetWriter(str(tmp), schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            raise ValueError(f'There are no predictions of {material} in {runner.data_dir}')
+        writer.close()
+    except BaseException:
+        # the previous table is kept as it is
+        if writer is not None:
+            writer.close()
+        tmp.unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp, path)
+    return path
+
+
+class PredictionTable(object):
+    """Read-only view of a precomputed prediction table.
+    Columns are loaded lazily and kept in memory; cif_id is kept sorted for lookups.
+    A property is only served while its checkpoint is the one the table was built with.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        parquet = pq.ParquetFile(str(self.path))
+        self.columns = set(parquet.schema_arrow.names) - {'cif_id'}
+
+        metadata = parquet.schema_arrow.metadata or {}
+        self.model_info = json.loads(metadata.get(b'model_info', b'{}'))
+        self.checkpoints = json.loads(metadata.get(b'checkpoints', b'{}'))
+
+        cif_id = pq.read_table(str(self.path), columns=['cif_id']).column('cif_id').to_numpy()
+        self._order = np.argsort(cif_id, kind='stable')
+        self.cif_id = cif_id[self._order].astype(str)
+
+        self._lock = threading.Lock()
+        self._values: Dict[str, np.ndarray] = {}
+
+    def __contains__(self, prop: str) -> bool:
+        return prop in self.columns
+
+    def __len__(self) -> int:
+        return len(self.cif_id)
+
+    def is_current(self, prop: str, model_dir: Path) -> bool:
+        """False when the checkpoint of `prop` changed since the table was built.
+        Without a local checkpoint (e.g. online-demo) the table is trusted"""
+        if prop not in self.checkpoints:
+            return False
+        current = checkpoint_hash(model_dir)
+        return current is None or current == self.checkpoints[prop]
+
+    def _column(self, prop: str) -> np.ndarray:
+        with self._lock:
+            if prop not in self._values:
+                column = pq.read_table(str(self.path), columns=[prop]).column(prop)
+                self._values[prop] = column.to_numpy(zero_copy_only=False)[self._order]
+            return self._values[prop]
+
+    def _match(self, token: str) -> np.ndarray:
+        """row indices of a material token (same rules as `MOFTransformerRunner.parse_data`)"""
+        token = token.strip()
+        if token.endswith('.cif'):
+            token = token[:-4]
+            if '*' not in token:
+                i = np.searchsorted(self.cif_id, token)
+                found = i < len(self.cif_id) and self.cif_id[i] == token
+                return np.array([i] if found else [], dtype=int)
+        if token == '*':
+            return np.arange(len(self.cif_id))
+
+        if '*' in token[:-1]:
+            regex = re.compile(re.escape(token).replace(r'\*', '.*'))
+            return np.array([i for i, c in enumerate(self.cif_id) if regex.fullmatch(c)], dtype=int)
+
+        prefix = token.rstrip('*')
+        start = np.searchsorted(self.cif_id, prefix, side='left')
+        end = np.searchsorted(self.cif_id, prefix + '\U0010ffff', side='left')
+        return np.arange(start, end)
+
+    def lookup(self, props: List[str], material: str) -> Optional[pd.DataFrame]:
+        """Return the predictions or None when a property or material is not in the table"""
+        if not all(prop in self for prop in props):
+            return None
+
+        index_ls = []
+        for token in re.split(r",\s*", material):
+            index = self._match(token)
+            if not len(index):
+                return None
+            index_ls.append(index)
+        index = np.unique(np.concatenate(index_ls))
+
+        df = pd.DataFrame({'cif_id': self.cif_id[index]})
+        for prop in props:
+            df[prop] = self._column(prop)[index]
+        return df
+
+
+_TABLES: Dict[str, Tuple[float, PredictionTable]] = {}
+_TABLES_LOCK = threading.Lock()
+
+
+def get_prediction_table(path: str = DEFAULT_TABLE) -> Optional[PredictionTable]:
+    """Process-wide table, reloaded when the file changes. None if it does not exist"""
+    if not path or not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _TABLES_LOCK:
+        if path not in _TABLES or _TABLES[path][0] != mtime:
+            _TABLES[path] = (mtime, PredictionTable(path))
+        return _TABLES[path][1]
+
+
+if __name__ == '__main__':
+    from revised_tools.predictor.runner import MOFTransformerRunner
+
+    runner = MOFTransformerRunner(
+        model_dir=config['model_dir'],
+        data_dir=config['data_dir']
+    )
+    path = precompute_table(runner)
+    table = get_prediction_table(str(path))
+    print (f'{path} : {len(table)} materials, {sorted(table.columns)}')
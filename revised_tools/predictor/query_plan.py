@@ -0,0 +1,189 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from chatmof.config import config
+from revised_tools.predictor.intent import ALIASES
+
+
+_NUMBER = r'(-?\d+(?:\.\d+)?(?:e-?\d+)?)'
+# a number followed by a unit is a condition (298 K, 1 bar), not a value of the property
+_VALUE = _NUMBER + r'(?![\d.e]|\s*(?:k|bar|kpa|pa|atm)\b)'
+_DESCENDING = r'highest|largest|greatest|maximum|max|most|best|biggest|top'
+_ASCENDING = r'lowest|smallest|minimum|min|least|worst'
+
+
+@dataclass
+class QueryPlan:
+    """One local pandas operation on the prediction table"""
+    op: str  # top, threshold, range, closest, sort
+    column: str
+    k: Optional[int] = None
+    ascending: bool = False
+    low: Optional[float] = None
+    high: Optional[float] = None
+    target: Optional[float] = None
+
+    def describe(self, n_rows: int, n_matched: int) -> str:
+        if self.op == 'top':
+            order = 'lowest' if self.ascending else 'highest'
+            return f'{self.k} {order} {self.column} of {n_rows} materials'
+        elif self.op == 'threshold' or self.op == 'range':
+            low = '-inf' if self.low is None else self.low
+            high = 'inf' if self.high is None else self.high
+            return f'{n_matched} of {n_rows} materials with {low} < {self.column} < {high}'
+        elif self.op == 'closest':
+            return f'{self.k} materials with {self.column} closest to {self.target} of {n_rows} materials'
+        order = 'ascending' if self.ascending else 'descending'
+        return f'{n_rows} materials sorted by {self.column} ({order})'
+
+
+def _named_columns(text: str, columns: List[str]) -> Tuple[List[str], str]:
+    """Return every column named in `text` and the text without their names"""
+    phrases = {col.replace('_', ' ').lower(): col for col in columns}
+    phrases.update({k: v for k, v in ALIASES.items() if v in columns})
+    named = []
+    for phrase in sorted(phrases, key=len, reverse=True):
+        if re.search(rf'\b{re.escape(phrase)}\b', text):
+            if phrases[phrase] not in named:
+                named.append(phrases[phrase])
+            text = re.sub(rf'\b{re.escape(phrase)}\b', ' ', text)
+    return named, text
+
+
+def _resolve_column(text: str, columns: List[str]) -> Tuple[Optional[str], str]:
+    """Return the only column named in `text` (None for several) and the text without it"""
+    named, text = _named_columns(text, columns)
+    if len(named) == 1:
+        return named[0], text
+    if not named and len(columns) == 1:
+        return columns[0], text
+    return None, text
+
+
+_RANGE = rf'between\s+{_VALUE}\s+and\s+{_VALUE}'
+_ABOVE = rf'(?:above|greater than|more than|higher than|larger than|over|exceeding|>)\s*{_VALUE}'
+_BELOW = rf'(?:below|less than|lower than|smaller than|under|<)\s*{_VALUE}'
+_CLOSEST = rf'(?:closest to|close to|nearest to|near|around)\s+{_VALUE}'
+
+
+def _n_conditions(text: str) -> int:
+    """number of conditions (filters, targets, orderings) in `text`"""
+    n = sum(len(re.findall(pattern, text)) for pattern in [_RANGE, _ABOVE, _BELOW, _CLOSEST])
+    n += bool(re.search(rf'\b({_ASCENDING})\b', text)) + bool(re.search(rf'\b({_DESCENDING})\b', text))
+    return n
+
+
+def numeric_columns(result: Union[pd.DataFrame, Path]) -> List[str]:
+    """Columns of `result` holding numbers (parquet schema only for a Path)"""
+    if isinstance(result, Path):
+        schema = pq.read_schema(result)
+        return [
+            field.name for field in schema
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        ]
+    return [col for col in result.columns if pd.api.types.is_numeric_dtype(result[col])]
+
+
+def parse_query(
+    question: str,
+    columns: List[str],
+    numeric: Optional[List[str]] = None,
+) -> Optional[QueryPlan]:
+    """Map the `Final Thought` of the predictor to a QueryPlan (None when no rule applies).
+    Only columns in `numeric` (default : all columns) can be planned on. A plan applies
+    exactly one condition to one column : compound queries are left to the LLM."""
+    columns = [col for col in columns if col != 'cif_id']
+    text = re.sub(r'[-_]', ' ', question.lower())
+    column, text = _resolve_column(text, columns)
+    if column is None or (numeric is not None and column not in numeric):
+        return None  # several columns, or a classification column (Stable / Unstable)
+    if _n_conditions(text) > 1:
+        return None  # e.g. 'bandgap above 2 and density below 1.5'
+
+    if m := re.search(_RANGE, text):
+        low, high = sorted([float(m.group(1)), float(m.group(2))])
+        return QueryPlan('range', column, low=low, high=high)
+
+    if m := re.search(_ABOVE, text):
+        return QueryPlan('threshold', column, low=float(m.group(1)))
+
+    if m := re.search(_BELOW, text):
+        return QueryPlan('threshold', column, high=float(m.group(1)))
+
+    k = None
+    if m := re.search(r'\b(?:top|first)\s+(\d+)\b|\b(\d+)\s+(?:materials|structures|mofs|candidates)\b', text):
+        k = int(m.group(1) or m.group(2))
+
+    if m := re.search(_CLOSEST, text):
+        return QueryPlan('closest', column, k=k or 1, target=float(m.group(1)))
+
+    if re.search(rf'\b({_ASCENDING})\b', text):
+        return QueryPlan('top', column, k=k or 1, ascending=True)
+    if re.search(rf'\b({_DESCENDING})\b', text):
+        return QueryPlan('top', column, k=k or 1, ascending=False)
+
+    if re.search(r'\b(sort|sorted|order|rank|ranking)\b', text):
+        ascending = bool(re.search(r'\bascending|increasing\b', text))
+        return QueryPlan('sort', column, k=k, ascending=ascending)
+    return None
+
+
+def execute(
+    plan: QueryPlan,
+    result: Union[pd.DataFrame, Path],
+    max_rows: int = config['max_length_in_predictor'],
+) -> Tuple[pd.DataFrame, str]:
+    """Run `plan` locally. Return the compact result (at most `max_rows` rows) and its summary"""
+    if isinstance(result, Path):
+        # rows are selected on two columns, then read with every column
+        df = pd.read_parquet(result, columns=['cif_id', plan.column], memory_map=True)
+    else:
+        df = result
+
+    values = pd.to_numeric(df[plan.column], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    n_rows = int(valid.sum())
+
+    if plan.op == 'top':
+        n_matched = min(plan.k, n_rows)
+        k = min(n_matched, max_rows)
+        keys = values if plan.ascending else -values
+        keys = np.where(valid, keys, np.inf)
+        index = np.argpartition(keys, k - 1)[:k] if 0 < k < len(keys) else np.arange(len(keys))[:k]
+        index = index[np.argsort(keys[index], kind='stable')]
+    elif plan.op in ['threshold', 'range']:
+        mask = valid.copy()
+        if plan.low is not None:
+            mask &= values > plan.low
+        if plan.high is not None:
+            mask &= values < plan.high
+        index = np.flatnonzero(mask)
+        n_matched = len(index)
+        index = index[np.argsort(-values[index], kind='stable')][:max_rows]
+    elif plan.op == 'closest':
+        n_matched = min(plan.k, n_rows)
+        k = min(n_matched, max_rows)
+        keys = np.where(valid, np.abs(values - plan.target), np.inf)
+        index = np.argpartition(keys, k - 1)[:k] if 0 < k < len(keys) else np.arange(len(keys))[:k]
+        index = index[np.argsort(keys[index], kind='stable')]
+    else:
+        keys = np.where(valid, values if plan.ascending else -values, np.inf)
+        index = np.argsort(keys, kind='stable')[:min(plan.k or max_rows, max_rows, n_rows)]
+        n_matched = n_rows
+
+    summary = plan.describe(n_rows, n_matched)
+    if len(index) < n_matched:
+        summary += f' (first {len(index)} shown)'
+    df_plan = df.iloc[index].reset_index(drop=True)
+    if isinstance(result, Path) and len(df_plan):
+        ids = df_plan['cif_id'].tolist()
+        df_full = pd.read_parquet(result, filters=[('cif_id', 'in', ids)])
+        df_plan = df_full.drop_duplicates('cif_id').set_index('cif_id').loc[ids].reset_index()
+    return df_plan, summary
@@ -2,18 +2,29 @@ import os
 from pathlib import Path
 import re
 import json
-from typing import List
-from pathlib import Path
+import tempfile
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pydantic import BaseModel
 from chatmof import __root_dir__
 from chatmof.config import config
-from chatmof.tools.predictor.utils import predict, model_names, search_file
+from revised_tools.predictor.utils import predict, model_names, search_file
+from revised_tools.predictor.inference import predict_direct, load_batches, run_batches
+from revised_tools.predictor.model_pool import get_model_pool
+from revised_tools.predictor.cache import PredictionCache, get_prediction_cache
+from revised_tools.predictor.material_index import get_material_index
 
 
 class MOFTransformerRunner(BaseModel):
     model_dir: str = config['model_dir']
     data_dir: str = config['data_dir']
     verbose: bool = False
+    engine: str = config.get('inference_engine', 'direct')  # 'direct' or 'trainer'
+    accelerator: Optional[str] = None  # None : 'cpu' for the direct engine, config['accelerator'] for the trainer
+    cache_path: Optional[str] = config.get('prediction_cache')  # None : disable cache
+    stream_chunk_size: int = config.get('stream_chunk_size', 1024)
 
     def run(self, 
             prop: str, 
@@ -25,15 +36,150 @@ class MOFTransformerRunner(BaseModel):
         model_dir = Path(self.model_dir)/prop
         data_list = self.parse_data(material)
 
-        output = predict(
-            data_list=data_list,
-            model_dir=model_dir,
-            verbose=self.verbose,
-        )
+        def predict_fn(data_list: List[Path]):
+            _predict = predict_direct if self.engine == 'direct' else predict
+            output = _predict(
+                data_list=data_list,
+                model_dir=model_dir,
+                verbose=self.verbose,
+                accelerator=self.get_accelerator(),
+            )
+            return self._parse_output(output, model_dir)
 
-        with (model_dir/'model_info.json').open() as f:
-            model_info = json.load(f)
+        cif_id, logits = self._run_cached(prop, data_list, predict_fn)
+        model_info = self._load_model_info(model_dir)
+        return cif_id, logits, model_info
+
+    def run_many(self,
+                 props: List[str],
+                 material: str) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """Predict several properties of the same materials in a single pass.
+        Inputs of each CIF are loaded and collated once and the shared batches are fed
+        to every requested model. Returns one wide DataFrame keyed by cif_id.
+        """
+        self._check_properties(props)
+        data_list = self.parse_data(material)
+        df = self._run_many(props, data_list)
+        info_ls = [self._load_model_info(Path(self.model_dir)/prop) for prop in props]
+        return df, info_ls
+
+    def run_stream(self,
+                   props: List[str],
+                   material: str) -> Iterator[pd.DataFrame]:
+        """Same as `run_many`, but yields wide DataFrames of `stream_chunk_size` CIFs"""
+        self._check_properties(props)
+        data_list = self.parse_data(material)
+        for i in range(0, len(data_list), self.stream_chunk_size):
+            yield self._run_many(props, data_list[i: i+self.stream_chunk_size])
+
+    def run_to_file(self,
+                    props: List[str],
+                    material: str,
+                    path: Optional[str] = None) -> Tuple[Path, List[Dict[str, Any]]]:
+        """Stream the predictions into a parquet file with bounded memory"""
+        is_temp = path is None
+        if is_temp:
+            fd, path = tempfile.mkstemp(suffix='.parquet', dir=config.get('stream_dir'))
+            os.close(fd)
+        path = Path(path)
+
+        writer = None
+        try:
+            for df in self.run_stream(props, material):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(str(path), table.schema)
+                writer.write_table(table.cast(writer.schema))
+        except BaseException:
+            # neither the temporary file nor a partially written table is left behind
+            if writer is not None:
+                writer.close()
+            if is_temp or writer is not None:
+                path.unlink(missing_ok=True)
+            raise
+        if writer is not None:
+            writer.close()
+
+        info_ls = [self._load_model_info(Path(self.model_dir)/prop) for prop in props]
+        return path, info_ls
+
+    def _check_properties(self, props: List[str]) -> None:
+        for prop in props:
+            if prop not in model_names:
+                raise ValueError(f'property should be one {model_names}, not {prop}')
+
+    def get_accelerator(self) -> str:
+        if self.accelerator:
+            return self.accelerator
+        return 'cpu' if self.engine == 'direct' else config['accelerator']
+
+    def _run_many(self, props: List[str], data_list: List[Path]) -> pd.DataFrame:
+        pool = get_model_pool(self.model_dir)
+        accelerator = self.get_accelerator()
+
+        batches = dict()
+        series_ls = []
+        for prop in props:
+            model_dir = Path(self.model_dir)/prop
+
+            def predict_fn(data_list: List[Path]):
+                if self.engine != 'direct':
+                    # the Trainer builds its own dataloader : batches are not shared
+                    output = predict(data_list, model_dir, self.verbose, accelerator=accelerator)
+                    return self._parse_output(output, model_dir)
 
+                model, _config = pool.get(prop, accelerator=accelerator)
+                # every fine-tuned model shares the input format, but check it anyway
+                key = (_config['nbr_fea_len'], _config['img_size'], _config['per_gpu_batchsize'],
+                       tuple(data_list))
+                if key not in batches:
+                    batches[key] = load_batches(data_list, _config)
+
+                output = run_batches(model, batches[key])
+                return self._parse_output(output, model_dir)
+
+            cif_id, logits = self._run_cached(prop, data_list, predict_fn)
+            series_ls.append(pd.Series(logits, index=cif_id, name=prop))
+
+        return pd.concat(series_ls, axis=1).rename_axis('cif_id').reset_index()
+
+    def get_cache(self) -> Optional[PredictionCache]:
+        if not self.cache_path:
+            return None
+        return get_prediction_cache(self.cache_path)
+
+    def _run_cached(
+            self,
+            prop: str,
+            data_list: List[Path],
+            predict_fn: Callable[[List[Path]], Tuple[List[str], List[Any]]],
+    ) -> Tuple[List[str], List[Any]]:
+        """Serve cached predictions and run `predict_fn` only for the missing inputs"""
+        cache = self.get_cache()
+        if cache is None:
+            return predict_fn(data_list)
+
+        model_hash = cache.model_hash(Path(self.model_dir)/prop)
+        hashes = [cache.input_hash(cif) for cif in data_list]
+        found = cache.get_many(prop, model_hash, hashes)
+
+        missing = [cif for cif, h in zip(data_list, hashes) if h not in found]
+        if missing:
+            cif_id, logits = predict_fn(missing)
+            predicted = dict(zip(cif_id, logits))
+            rows = [
+                (h, cif.stem, predicted[cif.stem]) 
+                for cif, h in zip(data_list, hashes) 
+                if h not in found and cif.stem in predicted
+            ]
+            cache.put_many(prop, model_hash, rows)
+            found.update({h: (cif_id, value) for h, cif_id, value in rows})
+
+        cif_id = [cif.stem for cif, h in zip(data_list, hashes) if h in found]
+        logits = [found[h][1] for h in hashes if h in found]
+        return cif_id, logits
+
+    def _parse_output(self, output: Dict[str, List[Any]], model_dir: Path) -> Tuple[List[str], List[Any]]:
         if 'regression_logits' in output:
             cif_id = output['cif_id']
             logits = output['regression_logits']
@@ -46,11 +192,18 @@ class MOFTransformerRunner(BaseModel):
             
             cif_id = output['cif_id']
             logits = [labels[i] for i in output['classification_logits_index']]
-            
-        return cif_id, logits, model_info
+        else:
+            raise ValueError(f'unknown output of model: {list(output.keys())}')
+
+        return cif_id, logits
+
+    def _load_model_info(self, model_dir: Path) -> Dict[str, Any]:
+        with (model_dir/'model_info.json').open() as f:
+            model_info = json.load(f)
+        return model_info
         
     def parse_data(self, material:str) -> List[Path]:
-        data_dir = Path(self.data_dir)
+        index = get_material_index(self.data_dir)
         data_list = []
 
         s_mat = re.split(r",\s*", material)
@@ -61,7 +214,7 @@ class MOFTransformerRunner(BaseModel):
                 else:
                     mat = f'{mat}*.cif'
 
-            if f_mat := search_file(mat, data_dir):
+            if f_mat := index.search(mat):
                 data_list.extend(f_mat)
 
         if len(data_list) < len(s_mat):
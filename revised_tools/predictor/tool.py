@@ -5,7 +5,7 @@ from langchain.tools import Tool
 from langchain.base_language import BaseLanguageModel
 from langchain.tools.base import BaseTool
 from chatmof import __root_dir__
-from revised_tools.predictor.base import Predictor
+from revised_tools.lazy import LazyChain
 
 
 
@@ -22,5 +22,10 @@ def _get_predict_properties(
             "You must use predictor before using google_search or wikipedia. "
             "The input must be a detailed full sentence to answer the question."
         ),
-        func=Predictor.from_llm(llm=llm, verbose=verbose).run,
-    )
\ No newline at end of file
+        func=LazyChain(lambda: _load_predictor(llm=llm, verbose=verbose)),
+    )
+
+
+def _load_predictor(llm: BaseLanguageModel, verbose: bool = False):
+    from revised_tools.predictor.base import Predictor
+    return Predictor.from_llm(llm=llm, verbose=verbose)
\ No newline at end of file
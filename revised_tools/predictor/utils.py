@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 from collections import defaultdict
 from functools import partial
@@ -8,7 +8,6 @@ import yaml
 import pytorch_lightning as pl
 from torch.utils.data import DataLoader
 
-from moftransformer.modules import Module
 from moftransformer.utils.validation import _IS_INTERACTIVE
 
 from chatmof.config import config as default_config
@@ -110,18 +109,16 @@ def predict(
         data_list: List[Path],
         model_dir: Path,
         verbose: bool = False,
+        accelerator: Optional[str] = None,
 ) -> Dict[str, List[str]]:
     
     #if not verbose:
     logging.getLogger("pytorch_lightning").setLevel(logging.ERROR)    
 
-    params = model_dir/'hparams.yaml'
-    p_model, = model_dir.glob('*.ckpt')
-    config = read_yaml(params)
-    update_config(config, p_model)
+    from revised_tools.predictor.model_pool import get_model_pool
+    model, config = get_model_pool(model_dir.parent).get(model_dir.name, accelerator=accelerator)
 
     dataloader = load_datamodule(data_list, config)
-    model = Module(config)
     trainer = load_trainer(config)
 
     rets = trainer.predict(model, dataloader)
@@ -17,6 +17,9 @@ from langchain.callbacks.manager import (
 from langchain.tools.base import BaseTool
 from langchain.utilities import PythonREPL
 
+from revised_tools.structure_cache import load_structure
+from revised_tools.python_repl.pool import get_repl_pool, current_session
+
 
 def _get_default_python_repl() -> PythonREPL:
     return PythonREPL(_globals=globals(), _locals=None)
@@ -48,10 +51,12 @@ class PythonREPLTool(BaseTool):
         "A Python shell. Use this to execute python commands. "
         "Input should be a valid python command. "
         "If you want to see the output of a value, you should print it out "
-        "with `print(...)`."
+        "with `print(...)`. "
+        "`load_structure(path)` reads a CIF file as ase.Atoms (cached)."
     )
     python_repl: PythonREPL = Field(_get_default_python_repl)
     sanitize_input: bool = True
+    use_pool: bool = True  # run in sandboxed worker processes (python_repl.pool) instead of in-process
 
     def _cleanup(self, query):
         query = query.replace("\\n", "\n")
@@ -66,6 +71,8 @@ class PythonREPLTool(BaseTool):
         if self.sanitize_input:
             query = sanitize_input(query)
         query = self._cleanup(query)
+        if self.use_pool:
+            return get_repl_pool().run(query)
         return self.python_repl.default().run(query)
 
     async def _arun(
@@ -78,6 +85,10 @@ class PythonREPLTool(BaseTool):
             query = sanitize_input(query)
         query = self._cleanup(query)
         loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.run, query)
+        if self.use_pool:
+            # the session is read here : executor threads do not inherit the context
+            result = await loop.run_in_executor(None, get_repl_pool().run, query, current_session.get())
+        else:
+            result = await loop.run_in_executor(None, self.run, query)
 
         return result
\ No newline at end of file
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+import socket
+import threading
+import subprocess
+import contextvars
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+from typing import Dict, Any, List, Optional
+
+from chatmof.config import config
+
+
+# session of the code being executed (set per agent run, e.g. by agent_worker.AgentRun)
+current_session: contextvars.ContextVar = contextvars.ContextVar('repl_session', default='default')
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')
+
+# environment variables not passed to the workers
+_SECRET = re.compile(r'KEY|TOKEN|SECRET|PASSWORD|CREDENTIAL', re.IGNORECASE)
+
+
+class _Worker(object):
+    """A clean interpreter running `worker.py`: nothing of the server process (other
+    sessions, LLM clients, API keys) is inherited, unlike a forked process."""
+    def __init__(self, memory_limit: Optional[int], max_sessions: int) -> None:
+        parent_sock, child_sock = socket.socketpair()
+        env = {name: value for name, value in os.environ.items() if not _SECRET.search(name)}
+        self.process = subprocess.Popen(
+            [
+                sys.executable, _WORKER, str(child_sock.fileno()), str(memory_limit or 0), str(max_sessions),
+                str(config.get('structure_cache_size', 256 * 1024 ** 2)),
+            ],
+            pass_fds=[child_sock.fileno()],
+            stdin=subprocess.DEVNULL,
+            env=env,
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        self.conn.close()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            pass
+        self.kill()
+
+
+class REPLPool(object):
+    """Pool of pre-warmed python REPL worker processes.
+
+    Each worker is a clean interpreter running `worker.py` (not a fork of the server),
+    with NumPy, pandas and ase imported once. Every execution is bounded by `cpu_time`
+    seconds of CPU (RLIMIT_CPU), `wall_timeout` seconds of wall clock (the worker is
+    killed and replaced) and `memory_limit` bytes of additional address space
+    (RLIMIT_AS). Each session is pinned to one worker, which keeps its globals
+    between executions; code of different sessions runs on different cores.
+    """
+    def __init__(
+        self,
+        n_workers: Optional[int] = config.get('num_workers_repl'),
+        cpu_time: float = config.get('repl_cpu_time', 30),
+        wall_timeout: float = config.get('repl_timeout', 60),
+        memory_limit: Optional[int] = config.get('repl_memory_limit', 2 * 1024 ** 3),
+        max_sessions: int = 32,
+    ) -> None:
+        self.n_workers = n_workers or min(os.cpu_count(), 4)
+        self.cpu_time = cpu_time
+        self.wall_timeout = wall_timeout
+        self.memory_limit = memory_limit
+        self.max_sessions = max_sessions
+
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = [self._spawn() for _ in range(self.n_workers)]
+        self._worker_locks = [threading.Lock() for _ in range(self.n_workers)]  # one execution at a time
+        self._sessions: 'OrderedDict[str, int]' = OrderedDict()  # session -> worker index
+
+        self.n_runs = 0
+        self.n_killed = 0
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.memory_limit, self.max_sessions)
+
+    def _assign(self, session: str) -> int:
+        with self._lock:
+            if session not in self._sessions:
+                # least loaded worker
+                loads = [0] * self.n_workers
+                for index in self._sessions.values():
+                    loads[index] += 1
+                self._sessions[session] = loads.index(min(loads))
+                if len(self._sessions) > self.max_sessions * self.n_workers:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session)
+            return self._sessions[session]
+
+    def _restart(self, index: int) -> None:
+        """replace a worker; the state of its sessions is lost"""
+        self._workers[index].kill()
+        self._workers[index] = self._spawn()
+        self.n_killed += 1
+
+    def run(self, code: str, session: Optional[str] = None) -> str:
+        """Execute `code` in the REPL of `session`. Return the printed output or the error"""
+        session = session or current_session.get()
+        index = self._assign(session)
+        self.n_runs += 1
+
+        with self._worker_locks[index]:
+            worker = self._workers[index]
+            if not worker.alive:
+                with self._lock:
+                    self._restart(index)
+                worker = self._workers[index]
+            start = time.monotonic()
+            try:
+                worker.conn.send((session, code, self.cpu_time))
+                if worker.conn.poll(self.wall_timeout):
+                    return worker.conn.recv()
+                error = f'TimeoutError: execution exceeded {self.wall_timeout} s and was killed'
+            except (EOFError, OSError):
+                error = f'WorkerDiedError: the python worker died after {time.monotonic() - start:.1f} s'
+            with self._lock:
+                self._restart(index)
+            return error
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.n_workers,
+            'sessions': len(self._sessions),
+            'runs': self.n_runs,
+            'killed': self.n_killed,
+        }
+
+
+_POOL: Optional[REPLPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_repl_pool() -> REPLPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = REPLPool()
+        return _POOL
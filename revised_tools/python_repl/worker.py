@@ -0,0 +1,123 @@
+"""Python REPL worker, run as a script in a clean interpreter by `pool.REPLPool`.
+
+Only the standard library is imported at module level: the worker does not load the
+revised_tools or chatmof packages (and the tools, LLMs and API keys of the server
+process). Settings are passed on the command line.
+
+usage : python worker.py <fd> <memory_limit> <max_sessions> <structure_cache_size>
+"""
+import os
+import sys
+import signal
+import resource
+import importlib.util
+from io import StringIO
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from multiprocessing.connection import Connection
+from typing import Dict, Any, Optional
+
+
+_PRELUDE = """
+import numpy as np
+import pandas as pd
+import ase
+import ase.io
+"""
+
+_STRUCTURE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'structure_cache.py')
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeExceeded('CPU time limit exceeded')
+
+
+def _address_space() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return 0
+
+
+def _cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _load_prelude(structure_cache_size: int) -> Dict[str, Any]:
+    """globals every session starts with (imported once per worker)"""
+    prelude: Dict[str, Any] = {}
+    for statement in _PRELUDE.strip().splitlines():
+        try:
+            exec(statement, prelude)
+        except ImportError:
+            pass
+    try:
+        # by file path : importing revised_tools.structure_cache would run the package __init__
+        spec = importlib.util.spec_from_file_location('structure_cache', _STRUCTURE_CACHE)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.get_structure_cache(structure_cache_size)  # sized here : chatmof.config is not read
+        prelude['load_structure'] = module.load_structure
+    except ImportError:
+        pass
+    return prelude
+
+
+def worker_loop(
+    conn: Connection,
+    memory_limit: Optional[int],
+    max_sessions: int,
+    structure_cache_size: int,
+) -> None:
+    prelude = _load_prelude(structure_cache_size)
+
+    if memory_limit:
+        # limit what the code allocates on top of the pre-warmed interpreter
+        limit = _address_space() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+    sessions: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        session, code, cpu_time = task
+
+        if session not in sessions:
+            sessions[session] = dict(prelude)
+            if len(sessions) > max_sessions:
+                sessions.popitem(last=False)
+        sessions.move_to_end(session)
+
+        # RLIMIT_CPU counts the whole process : the soft limit is moved for every execution
+        soft = int(_cpu_time() + cpu_time) + 1
+        if cpu_hard != resource.RLIM_INFINITY:
+            soft = min(soft, cpu_hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, cpu_hard))
+
+        stdout = StringIO()
+        try:
+            with redirect_stdout(stdout):
+                exec(code, sessions[session])
+            output = stdout.getvalue()
+        except BaseException as e:  # MemoryError and CPUTimeExceeded included
+            output = repr(e)
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+        conn.send(output)
+
+
+if __name__ == '__main__':
+    fd, memory_limit, max_sessions, structure_cache_size = sys.argv[1:5]
+    worker_loop(Connection(int(fd)), int(memory_limit) or None, int(max_sessions), int(structure_cache_size))
@@ -0,0 +1,154 @@
+import os
+import copy
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+
+
+# chatmof.config is not imported at module level : the python REPL worker loads this
+# module by path, without the chatmof package (see python_repl/worker.py)
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+@dataclass
+class Structure:
+    """Structure parsed from a CIF, without the overhead of ase.Atoms (about 25 bytes
+    per atom). Positions keep full precision; `info` and the other per-atom arrays of
+    the reader (e.g. site labels) are kept, so `to_atoms` returns what ase.io.read does."""
+    numbers: np.ndarray  # (N,) uint8
+    positions: np.ndarray  # (N, 3) float64, cartesian
+    cell: np.ndarray  # (3, 3) float64
+    pbc: np.ndarray  # (3,) bool
+    info: Dict[str, Any] = field(default_factory=dict)
+    arrays: Dict[str, np.ndarray] = field(default_factory=dict)  # other per-atom arrays
+
+    @classmethod
+    def from_atoms(cls, atoms) -> 'Structure':
+        return cls(
+            numbers=np.asarray(atoms.numbers, dtype=np.uint8),
+            positions=np.array(atoms.positions, dtype=np.float64),
+            cell=np.array(atoms.cell, dtype=np.float64),
+            pbc=np.array(atoms.pbc, dtype=bool),
+            info=copy.deepcopy(atoms.info),
+            arrays={
+                name: np.array(value) for name, value in atoms.arrays.items()
+                if name not in ['numbers', 'positions']
+            },
+        )
+
+    def to_atoms(self):
+        """new (mutable) ase.Atoms"""
+        from ase import Atoms
+        atoms = Atoms(
+            numbers=self.numbers.astype(int),
+            positions=self.positions.copy(),
+            cell=self.cell,
+            pbc=self.pbc,
+            info=copy.deepcopy(self.info),
+        )
+        for name, value in self.arrays.items():
+            atoms.new_array(name, value.copy())
+        return atoms
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.numbers.nbytes + self.positions.nbytes + self.cell.nbytes + self.pbc.nbytes
+            + sum(value.nbytes for value in self.arrays.values())
+        )
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+
+class StructureCache(object):
+    """Process-wide cache of parsed CIFs keyed by (path, mtime).
+
+    Each CIF is parsed with `ase.io.read` once and kept as a compact Structure;
+    an entry is stale as soon as the file is rewritten. Least recently used entries
+    are dropped above `max_bytes`.
+    """
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self._cache: 'OrderedDict[Tuple[str, int], Structure]' = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path: Union[str, Path]) -> Tuple[str, int]:
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def get(self, path: Union[str, Path]) -> Structure:
+        key = self._key(path)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        import ase.io
+        structure = Structure.from_atoms(ase.io.read(key[0]))
+        self._put(key, structure)
+        return structure
+
+    def atoms(self, path: Union[str, Path]):
+        """ase.Atoms of `path` (a new object for every call)"""
+        return self.get(path).to_atoms()
+
+    def add(self, path: Union[str, Path], structure: Union[Structure, Any]) -> None:
+        """register a structure that was just written to `path` (Structure or ase.Atoms)"""
+        if not isinstance(structure, Structure):
+            structure = Structure.from_atoms(structure)
+        self._put(self._key(path), structure)
+
+    def _put(self, key: Tuple[str, int], structure: Structure) -> None:
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = structure
+            self._n_bytes += structure.nbytes
+            while self._n_bytes > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._n_bytes -= old.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'structures': len(self._cache),
+            'bytes': self._n_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+_CACHE: Optional[StructureCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_structure_cache(max_bytes: Optional[int] = None) -> StructureCache:
+    """Process-wide cache. `max_bytes` (default : config['structure_cache_size']) only
+    applies to the first call, which creates the cache"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            if max_bytes is None:
+                from chatmof.config import config
+                max_bytes = config.get('structure_cache_size', DEFAULT_MAX_BYTES)
+            _CACHE = StructureCache(max_bytes)
+        return _CACHE
+
+
+def load_structure(path: Union[str, Path]):
+    """Read a CIF as ase.Atoms through the shared structure cache"""
+    return get_structure_cache().atoms(path)
@@ -2,13 +2,11 @@ import os
 import re
 from pathlib import Path
 import pandas as pd
-from typing import Dict, Any, List, Optional
-from PIL import Image
-import matplotlib.pyplot as plt
-from ase.visualize.plot import plot_atoms
+from typing import Dict, Any, List, Optional, Tuple
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-import ase.io
 import ase.visualize
 from langchain.base_language import BaseLanguageModel
 from langchain.chains.base import Chain
@@ -19,13 +17,18 @@ from langchain.callbacks.manager import CallbackManagerForChainRun
 from chatmof.config import config
 from chatmof.utils import search_file
 from revised_tools.visualizer.prompt import PROMPT
+from revised_tools.visualizer.render import get_render_service, compose_grid
+from revised_tools.visualizer.viewer3d import viewer_html
+from revised_tools.structure_cache import load_structure
 from revised_tools.error import ChatMOFOnlineError
+from revised_tools.llm_cache import CachedLLMChain, get_prompt_cache
 
 
 class Visualizer(Chain):
     """Tools that search csv using Pandas agent"""
     llm_chain: LLMChain
     data_dir: Path = Path(config['structure_dir'])
+    mode: str = config.get('visualizer_mode', 'image')  # 'image' (png) or '3d' (interactive viewer)
     input_key: str = 'question'
     output_key: str = 'answer'
 
@@ -53,8 +56,30 @@ class Visualizer(Chain):
             'Material': (material.group(1) if material else None),
         }
 
+    def _show(self, image: bytes, material: str, run_manager: CallbackManagerForChainRun) -> None:
+        # handlers of a background agent run (agent_worker) receive the image with the log
+        run_manager.on_text(
+            f"\n[Visualizer] Image: {material}\n", verbose=self.verbose, image=image, caption=material
+        )
+        if get_script_run_ctx() is not None:
+            st.image(image, caption=material, use_column_width=True)
+
+    def _show_3d(self, html: str, material: str, run_manager: CallbackManagerForChainRun) -> None:
+        run_manager.on_text(
+            f"\n[Visualizer] 3D view: {material}\n", verbose=self.verbose, html=html, caption=material
+        )
+        if get_script_run_ctx() is not None:
+            components.html(html, height=420)
+
+    @staticmethod
+    def _parse_supercell(question: str) -> Tuple[int, int, int]:
+        """'2x2x1 supercell' -> (2, 2, 1)"""
+        if m := re.search(r"\b([1-4])\s*[x×]\s*([1-4])\s*[x×]\s*([1-4])\b", question):
+            return tuple(int(n) for n in m.groups())
+        return (1, 1, 1)
+
     def _visualize(self, f_st: Path) -> None:
-        atoms = ase.io.read(f_st)
+        atoms = load_structure(f_st)
         ase.visualize.view(atoms)
     
     def _call(
@@ -72,10 +97,14 @@ class Visualizer(Chain):
         )
 
         output = self._parse_output(llm_output)
-        self._write_log('Thought', output['Thought'], run_manager)
-        self._write_log('Material', output['Material'], run_manager)
+        self._write_log('Thought', output['Thought'], _run_manager)
+        self._write_log('Material', output['Material'], _run_manager)
+
+        supercell = self._parse_supercell(inputs[self.input_key])
+        mode = '3d' if supercell != (1, 1, 1) else self.mode
 
         materials = output['Material'].split(',')
+        names, cifs = [], []
         for material in materials:
             material = material.strip()
             material = material.replace("_clean", "")
@@ -84,19 +113,27 @@ class Visualizer(Chain):
                 cif = Path(f'cifs/{material}.cif').resolve()
                 if not cif.exists():
                     raise FileNotFoundError(f'{cif} does not exists.')
-                atoms = ase.io.read(cif)
-                file = f'savefig/{material}.png'
-
-                fig, ax = plt.subplots()
-                plot_atoms(atoms, ax)#, radii=0.3, rotation=('45x,45y,45z'))
-                plt.savefig(file, bbox_inches='tight')  # Save the figure
-                plt.close(fig)  # Close the figure window
-                image = Image.open(file)
-                st.image(image, use_column_width=True,)
+                names.append(material)
+                cifs.append(cif)
 
             else:
                 raise ChatMOFOnlineError('ChatMOF online-demo does not support visualizer. If you want use more toolkits, please use code on our github.')
 
+        if mode == '3d':
+            # the browser draws : no rasterization on the server
+            for material, cif in zip(names, cifs):
+                self._show_3d(viewer_html(cif, supercell=supercell), material, _run_manager)
+        elif len(cifs) == 1:
+            self._show(get_render_service().render(cifs[0]), names[0], _run_manager)
+        else:
+            # render in parallel and show one grid image (one UI update)
+            images, timings = get_render_service().render_many(cifs)
+            self._write_log('Render time', ', '.join(
+                f'{material} {"cached" if t is None else f"{t:.2f} s"}'
+                for material, t in zip(names, timings)
+            ) + '\n', _run_manager)
+            self._show(compose_grid(images, names), ', '.join(names), _run_manager)
+
         return {self.output_key: f'The visualizer has successfully visualized the structure {materials}.'}
     
     @classmethod
@@ -110,5 +147,5 @@ class Visualizer(Chain):
             template=prompt,
             input_variables=['question'],
         )
-        llm_chain = LLMChain(llm=llm, prompt=template)
+        llm_chain = CachedLLMChain(llm=llm, prompt=template, prompt_cache=get_prompt_cache())
         return cls(llm_chain=llm_chain, **kwargs)
\ No newline at end of file
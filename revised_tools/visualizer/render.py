@@ -0,0 +1,216 @@
+import io
+import os
+import math
+import time
+import hashlib
+import threading
+import multiprocessing as mp
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from ase.visualize.plot import plot_atoms
+
+from chatmof.config import config
+from revised_tools.structure_cache import get_structure_cache
+
+
+_HASHES: Dict[Tuple[str, int, int], str] = {}
+_HASHES_LOCK = threading.Lock()
+
+
+def cif_hash(cif: Path) -> str:
+    """Content hash of `cif`, memoized by (path, mtime, size)"""
+    stat = os.stat(cif)
+    key = (str(cif), stat.st_mtime_ns, stat.st_size)
+    with _HASHES_LOCK:
+        if key in _HASHES:
+            return _HASHES[key]
+    with open(cif, 'rb') as f:
+        digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    with _HASHES_LOCK:
+        _HASHES[key] = digest
+    return digest
+
+
+def render_png(
+    atoms,
+    rotation: str = '0x,0y,0z',
+    radii: float = 1.0,
+    dpi: int = 100,
+) -> bytes:
+    """Draw `atoms` with plot_atoms into a PNG in memory.
+    A Figure without pyplot keeps no global state, so renders can run concurrently.
+    """
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    plot_atoms(atoms, ax, rotation=rotation, radii=radii)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
+    return buffer.getvalue()
+
+
+def _render_job(cif: str, rotation: str, radii: float, dpi: int) -> Tuple[bytes, float]:
+    """Render one CIF (runs in worker processes). Return (png, seconds)"""
+    start = time.perf_counter()
+    png = render_png(get_structure_cache().get(cif).to_atoms(), rotation=rotation, radii=radii, dpi=dpi)
+    return png, time.perf_counter() - start
+
+
+def compose_grid(
+    images: List[bytes],
+    captions: List[str],
+    tile: int = 320,
+    n_cols: Optional[int] = None,
+) -> bytes:
+    """Compose PNG images into one captioned grid (sprite) PNG"""
+    n_cols = n_cols or math.ceil(math.sqrt(len(images)))
+    n_rows = math.ceil(len(images) / n_cols)
+    caption_height = 20
+
+    grid = Image.new('RGB', (n_cols * tile, n_rows * (tile + caption_height)), 'white')
+    draw = ImageDraw.Draw(grid)
+    for i, (png, caption) in enumerate(zip(images, captions)):
+        image = Image.open(io.BytesIO(png)).convert('RGB')
+        image.thumbnail((tile, tile))
+        x = (i % n_cols) * tile
+        y = (i // n_cols) * (tile + caption_height)
+        grid.paste(image, (x + (tile - image.width) // 2, y + (tile - image.height) // 2))
+        draw.text((x + 5, y + tile + 4), caption, fill='black')
+
+    buffer = io.BytesIO()
+    grid.save(buffer, format='png')
+    return buffer.getvalue()
+
+
+class RenderService(object):
+    """Render CIFs to PNG bytes with an LRU cache keyed by (CIF hash, view parameters).
+
+    The cache is bounded by `max_bytes` of PNG data. Nothing is written to disk, so
+    sessions never share (or race on) an output path. Batches are rendered on one
+    persistent pool of `n_workers` processes started from a forkserver, never forked
+    from the (multithreaded) server.
+    """
+    def __init__(
+        self,
+        max_bytes: int = config.get('render_cache_size', 64 * 1024 ** 2),
+        n_workers: Optional[int] = config.get('num_workers_render'),
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.n_workers = n_workers or os.cpu_count()
+        self._cache: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def render(
+        self,
+        cif: Path,
+        rotation: str = '0x,0y,0z',
+        radii: float = 1.0,
+        dpi: int = 100,
+    ) -> bytes:
+        key = (cif_hash(cif), rotation, radii, dpi)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        png = render_png(get_structure_cache().get(cif).to_atoms(), rotation=rotation, radii=radii, dpi=dpi)
+        self._put(key, png)
+        return png
+
+    def render_many(
+        self,
+        cifs: List[Path],
+        rotation: str = '0x,0y,0z',
+        radii: float = 1.0,
+        dpi: int = 100,
+    ) -> Tuple[List[bytes], List[Optional[float]]]:
+        """Render `cifs` with cached views served directly and the others in parallel
+        worker processes. Return (images, render seconds; None for cached views)"""
+        keys = [(cif_hash(cif), rotation, radii, dpi) for cif in cifs]
+        images: List[Optional[bytes]] = [None] * len(cifs)
+        timings: List[Optional[float]] = [None] * len(cifs)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    images[i] = self._cache[key]
+            self.hits += sum(image is not None for image in images)
+            self.misses += sum(image is None for image in images)
+
+        missing = [i for i, image in enumerate(images) if image is None]
+        outputs = []
+        if len(missing) > 1 and self.n_workers > 1:
+            n = len(missing)
+            try:
+                outputs = list(self._get_executor().map(
+                    _render_job, [str(cifs[i]) for i in missing], [rotation] * n, [radii] * n, [dpi] * n
+                ))
+            except BrokenProcessPool:
+                self._reset_executor()  # a worker died : started again on the next batch
+        if len(outputs) < len(missing):
+            outputs = [_render_job(str(cifs[i]), rotation, radii, dpi) for i in missing]
+
+        for i, (png, elapsed) in zip(missing, outputs):
+            images[i], timings[i] = png, elapsed
+            self._put(keys[i], png)
+        return images, timings
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.n_workers, mp_context=mp.get_context('forkserver')
+                )
+            return self._executor
+
+    def _reset_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _put(self, key: Tuple, png: bytes) -> None:
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = png
+            self._n_bytes += len(png)
+            while self._n_bytes > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._n_bytes -= len(old)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'images': len(self._cache),
+            'bytes': self._n_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+_SERVICE: Optional[RenderService] = None
+_SERVICE_LOCK = threading.Lock()
+
+
+def get_render_service() -> RenderService:
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None:
+            _SERVICE = RenderService()
+        return _SERVICE
@@ -5,7 +5,7 @@ from langchain.base_language import BaseLanguageModel
 from langchain.tools.base import BaseTool
 
 from chatmof.config import config
-from revised_tools.visualizer.base import Visualizer
+from revised_tools.lazy import LazyChain
 
 
 def _get_visualizer(
@@ -20,7 +20,10 @@ def _get_visualizer(
                 "A tools to visualize the structure. "
                 "The input must be a detailed full sentence to answer the question."
         ),
-        func=Visualizer.from_llm(
-            llm=llm, verbose=verbose
-        ).run
+        func=LazyChain(lambda: _load_visualizer(llm=llm, verbose=verbose))
     )
+
+
+def _load_visualizer(llm: BaseLanguageModel, verbose: bool = False):
+    from revised_tools.visualizer.base import Visualizer
+    return Visualizer.from_llm(llm=llm, verbose=verbose)
@@ -0,0 +1,100 @@
+import itertools
+from pathlib import Path
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import py3Dmol
+from ase.data import chemical_symbols
+
+from chatmof.config import config
+from revised_tools.structure_cache import Structure, get_structure_cache
+from revised_tools.visualizer.render import cif_hash
+
+
+# above this number of atoms, sticks are replaced by lines (cheaper to draw in the browser)
+LINE_STYLE_ATOMS = 2000
+
+
+def make_supercell(structure: Structure, supercell: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (numbers, positions, cell) repeated `supercell` times (float32 positions : display only)"""
+    shifts = np.array(list(itertools.product(*[range(n) for n in supercell])), dtype=np.float32)
+    translations = shifts @ structure.cell.astype(np.float32)  # (n_images, 3)
+    positions = structure.positions.astype(np.float32)
+    positions = (positions[None, :, :] + translations[:, None, :]).reshape(-1, 3)
+    numbers = np.tile(structure.numbers, len(shifts))
+    cell = structure.cell * np.array(supercell)[:, None]
+    return numbers, positions, cell
+
+
+def decimate(numbers: np.ndarray, positions: np.ndarray, max_atoms: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Level of detail : drop hydrogens first, then keep an even subsample of `max_atoms` atoms"""
+    if len(numbers) <= max_atoms:
+        return numbers, positions
+    heavy = numbers != 1
+    if heavy.any():
+        numbers, positions = numbers[heavy], positions[heavy]
+    if len(numbers) > max_atoms:
+        index = np.linspace(0, len(numbers) - 1, max_atoms).astype(int)
+        numbers, positions = numbers[index], positions[index]
+    return numbers, positions
+
+
+def xyz_payload(numbers: np.ndarray, positions: np.ndarray, comment: str = '') -> str:
+    """Compact XYZ text (2 decimals are enough for display)"""
+    symbols = np.array(chemical_symbols)[numbers]
+    lines = [f'{s} {x:.2f} {y:.2f} {z:.2f}' for s, (x, y, z) in zip(symbols, positions)]
+    return f'{len(lines)}\n{comment}\n' + '\n'.join(lines)
+
+
+def _add_cell(view: 'py3Dmol.view', cell: np.ndarray) -> None:
+    corners = np.array(list(itertools.product([0, 1], repeat=3))) @ cell
+    for i, j in itertools.combinations(range(8), 2):
+        if bin(i ^ j).count('1') == 1:  # corners that differ in one lattice vector
+            start, end = corners[i], corners[j]
+            view.addLine({
+                'start': dict(zip('xyz', map(float, start))),
+                'end': dict(zip('xyz', map(float, end))),
+                'color': 'black',
+            })
+
+
+@lru_cache(maxsize=64)
+def _viewer_html(
+    path: str,
+    digest: str,  # part of the cache key : a rewritten CIF is rendered again
+    supercell: Tuple[int, int, int],
+    max_atoms: int,
+    width: int,
+    height: int,
+) -> str:
+    structure = get_structure_cache().get(path)
+    numbers, positions, cell = make_supercell(structure, supercell)
+    n_atoms = len(numbers)
+    numbers, positions = decimate(numbers, positions, max_atoms)
+
+    comment = Path(path).stem if len(numbers) == n_atoms else f'{Path(path).stem} ({len(numbers)}/{n_atoms} atoms)'
+    view = py3Dmol.view(width=width, height=height)
+    view.addModel(xyz_payload(numbers, positions, comment), 'xyz')
+    if len(numbers) > LINE_STYLE_ATOMS:
+        view.setStyle({'line': {}})
+    else:
+        view.setStyle({'stick': {'radius': 0.15}, 'sphere': {'scale': 0.25}})
+    _add_cell(view, cell)
+    view.zoomTo()
+    return view._make_html()  # standalone snippet (py3Dmol 2.x, pinned in requirements.txt)
+
+
+def viewer_html(
+    cif: Path,
+    supercell: Tuple[int, int, int] = (1, 1, 1),
+    max_atoms: int = config.get('viewer_max_atoms', 10000),
+    width: int = 640,
+    height: int = 400,
+) -> str:
+    """Interactive 3Dmol.js viewer of `cif` as a standalone HTML snippet.
+
+    Only the (decimated) XYZ payload is sent to the browser, which does all the drawing.
+    """
+    cif = str(Path(cif).resolve())
+    return _viewer_html(cif, cif_hash(cif), tuple(supercell), max_atoms, width, height)
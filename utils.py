@@ -1,10 +1,11 @@
-import sys
-import contextlib
-import re
+import hashlib
+from typing import List, Optional
 
 import streamlit as st
 
 from langchain.agents import initialize_agent, AgentType
+from langchain.chat_models import ChatOpenAI
+from chatmof import ChatMOF
 from chatmof.agents.prompt import PREFIX, FORMAT_INSTRUCTIONS, SUFFIX
 from revised_tools.tool_utils import load_chatmof_tools_revised
 
@@ -15,12 +16,14 @@ def from_llm_revised(
     llm,
     verbose: bool = False,
     search_internet: bool = True,
+    tools: Optional[List] = None,  # shared tools (see `_load_tools`)
 ):
-    tools = load_chatmof_tools_revised(
-        llm=llm, 
-        verbose=verbose, 
-        search_internet=search_internet
-    )
+    if tools is None:
+        tools = load_chatmof_tools_revised(
+            llm=llm, 
+            verbose=verbose, 
+            search_internet=search_internet
+        )
     
     agent_kwargs = {
         'prefix': PREFIX,
@@ -41,30 +44,68 @@ def from_llm_revised(
     return cls(agent=agent, llm=llm, verbose=verbose)
 
 
-def clean_log(s):
-    s = re.sub(r".+?m", '', s)
-    if re.search(r"\B> ", s):
-        return None
-    s = re.sub(
-        r"\s(?P<name>Action Input|Action|Observation|Final Thought|Thought|Input|Final Answer|Answer|Property|Materials):", 
-        lambda t: "\n`{}`:".format(t.group('name')), 
-        s,
+def key_fingerprint(openai_api_key: str) -> str:
+    return hashlib.sha256(openai_api_key.encode()).hexdigest()[:16]
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _load_tools(
+    model_name: str, 
+    fingerprint: str, 
+    _openai_api_key: str,  # not hashed : the fingerprint is the key
+    verbose: bool = False,
+):
+    """Tools with their chains and prompts, built once per (model, key). Their llm runs
+    at temperature 0; the temperature of the demo applies to the agent"""
+    llm = ChatOpenAI(
+        temperature=0,
+        model_name=model_name,
+        openai_api_key=_openai_api_key
+    )
+    return load_chatmof_tools_revised(llm=llm, verbose=verbose, search_internet=True)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _load_chatmof(
+    model_name: str, 
+    temperature: float, 
+    fingerprint: str, 
+    _openai_api_key: str,  # not hashed : the fingerprint is the key
+    verbose: bool = False,
+):
+    llm = ChatOpenAI(
+        temperature=temperature,
+        model_name=model_name,
+        openai_api_key=_openai_api_key
     )
-    s = re.sub(r"\[(?P<name>.+?)\]", lambda t: '**[{}]**'.format(t.group('name')), s)
-    return s.strip()
-
-
-@contextlib.contextmanager
-def capture_stdout():
-    class Stream:
-        def write(self, s):
-            s = clean_log(s)
-            if s:
-                st.write(s)
-
-    old_stdout = sys.stdout
-    sys.stdout = Stream()  # Redirect stdout
-    try:
-        yield
-    finally:
-        sys.stdout = old_stdout  # Restore stdout
\ No newline at end of file
+    tools = _load_tools(model_name, fingerprint, _openai_api_key, verbose=verbose)
+    return ChatMOF.from_llm(llm=llm, verbose=verbose, tools=tools)
+
+
+def load_chatmof(
+    model_name: str, 
+    temperature: float, 
+    openai_api_key: str, 
+    verbose: bool = False,
+):
+    """ChatMOF agent cached per session and per process by (model, temperature, key fingerprint).
+    Tools and prompts are built once per model and key, so a new temperature only builds
+    the llm and the agent; widget interactions that do not change the key (e.g. selecting
+    a question) reuse the agent as it is.
+    """
+    key = (model_name, temperature, key_fingerprint(openai_api_key), verbose)
+    if st.session_state.get('chatmof_key') != key:
+        st.session_state['chatmof'] = _load_chatmof(
+            model_name, temperature, key[2], openai_api_key, verbose=verbose
+        )
+        st.session_state['chatmof_key'] = key
+    return st.session_state['chatmof']
+
+
+@st.cache_data(show_spinner=False)
+def load_questions(path: str = 'questions.txt') -> List[str]:
+    with open(path) as f:
+        questions = [
+            line.strip() for line in f
+        ]
+    return questions